@@ -0,0 +1,89 @@
+'''Concurrency check for the single-statement reaction path
+
+Seeds a throwaway schema with one post and --users readers, then fires --reactions
+parallel like/dislike requests through apply_reaction, with users switching their
+reaction back and forth. Afterwards the post counters must match the reactions table
+exactly, and every user must have at most one reaction.
+
+    python -m benchmarks.concurrent_reactions --users 200 --reactions 1000
+'''
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import func, select, text
+
+from social_media.auth.models import Post, Reaction
+from social_media.helpers.reactions import REACTIONS, apply_reaction
+
+from .schema import throwaway_schema
+
+SCHEMA = "bench_concurrent_reactions"
+POST_ID = 1
+AUTHOR_ID = 1
+
+
+async def seed(engine, users):
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO users (id, username) SELECT i, 'user' || i FROM generate_series(1, :users) AS i"),
+            dict(users=users + 1)
+        )
+        await conn.execute(
+            text("INSERT INTO posts (id, title, description, author_id) VALUES (:post, 'Post', '', :author)"),
+            dict(post=POST_ID, author=AUTHOR_ID)
+        )
+
+
+async def react(session_maker, user_id, reaction):
+    async with session_maker() as session:
+        if await apply_reaction(session, POST_ID, user_id, reaction):
+            await session.commit()
+            return True
+    return False
+
+
+async def main(args):
+    async with throwaway_schema(SCHEMA, pool_size=args.connections, max_overflow=0) as (engine, session_maker):
+        await seed(engine, args.users)
+
+        requests = [
+            (random.randint(AUTHOR_ID + 1, args.users + 1), random.choice(REACTIONS)) for _ in range(args.reactions)
+        ]
+        # The author reacting to their own post must never be recorded
+        requests.append((AUTHOR_ID, "like"))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(react(session_maker, user_id, reaction) for user_id, reaction in requests))
+        elapsed = time.perf_counter() - start
+
+        async with session_maker() as session:
+            post = await session.get(Post, POST_ID)
+            query = select(Reaction.reaction, func.count()).where(Reaction.post_id == POST_ID)
+            counts = dict((await session.execute(query.group_by(Reaction.reaction))).all())
+            duplicates = await session.scalar(
+                select(func.count()).select_from(
+                    select(Reaction.user_id).group_by(Reaction.user_id).having(func.count() > 1).subquery()
+                )
+            )
+            own_reactions = await session.scalar(select(func.count()).where(Reaction.user_id == AUTHOR_ID))
+
+        rate = len(requests) / elapsed
+        print(f"{len(requests)} reactions in {elapsed:.2f}s ({rate:,.0f}/s), {sum(results)} applied")
+        print(f"post counters: likes={post.likes} dislikes={post.dislikes}")
+        print(f"reaction rows: likes={counts.get('like', 0)} dislikes={counts.get('dislike', 0)}")
+
+        assert post.likes == counts.get("like", 0), "likes counter drifted"
+        assert post.dislikes == counts.get("dislike", 0), "dislikes counter drifted"
+        assert duplicates == 0, "a user has more than one reaction"
+        assert own_reactions == 0, "the author reacted to their own post"
+        print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--reactions", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
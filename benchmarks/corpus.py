@@ -0,0 +1,20 @@
+'''Synthetic post descriptions for the recommendation benchmarks'''
+import numpy as np
+
+
+def make_corpus(posts, vocabulary=20000, topics=200, words_per_topic=60, length=40, seed=0):
+    '''(post_id, description) pairs, each post mixing its topic's words with Zipf-distributed background words
+
+    Posts of the same topic share vocabulary, so nearest neighbours are meaningful
+    rather than noise, like real posts about the same subject.
+    '''
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    topic_words = rng.integers(0, vocabulary, size=(topics, words_per_topic))
+    background = np.minimum(rng.zipf(1.3, size=(posts, length)), vocabulary) - 1
+    post_topics = rng.integers(0, topics, size=posts)
+    topical = rng.random((posts, length)) < 0.5
+    picks = topic_words[post_topics[:, np.newaxis], rng.integers(0, words_per_topic, size=(posts, length))]
+    tokens = np.where(topical, picks, background)
+
+    return [(post_id + 1, " ".join(words[row])) for post_id, row in enumerate(tokens)]
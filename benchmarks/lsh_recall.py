@@ -0,0 +1,69 @@
+'''Recall and build time of the LSH recommendation index against exact neighbours
+
+Fits the model exactly once, then with every --tables x --bits combination, and
+reports how many of each post's exact top 3 the approximate top 3 recovers, and
+how much of the exact top 3 similarity it reaches (near ties among posts on the
+same topic are misses for recall but not for the score). The default grid includes
+the configured RECOMMENDATION_LSH_TABLES x RECOMMENDATION_LSH_BITS.
+
+    python -m benchmarks.lsh_recall --posts 20000 --tables 8 16 32 --bits 6 8 12
+'''
+import argparse
+import time
+
+import numpy as np
+
+from social_media.ai.model import RecommendationModel
+from social_media.config import RECOMMENDATION_LSH_BITS, RECOMMENDATION_LSH_TABLES
+
+from .corpus import make_corpus
+
+
+def recall_at(exact, approximate, k):
+    hits = total = 0
+    for row in range(len(exact.post_ids)):
+        expected = set(exact.neighbours[row, :k].tolist()) - {-1}
+        found = set(approximate.neighbours[row, :k].tolist())
+        hits += len(expected & found)
+        total += len(expected)
+    return hits / total if total else 1.0
+
+
+def score_ratio(exact, approximate, k):
+    '''Similarity the approximate top k reaches, relative to the exact top k'''
+    expected = exact.scores[:, :k].sum()
+    return approximate.scores[:, :k].sum() / expected if expected else 1.0
+
+
+def main(args):
+    posts = make_corpus(args.posts)
+
+    start = time.perf_counter()
+    exact = RecommendationModel.fit(posts)
+    print(f"{'exact':>16}   fit {time.perf_counter() - start:7.2f} s")
+
+    for tables in args.tables:
+        for bits in args.bits:
+            start = time.perf_counter()
+            approximate = RecommendationModel.fit(posts, lsh_tables=tables, lsh_bits=bits)
+            elapsed = time.perf_counter() - start
+
+            sample = np.random.default_rng(0).integers(0, len(posts), size=min(200, len(posts)))
+            start = time.perf_counter()
+            for row in sample:
+                approximate.similar_to(posts[row][1])
+            query_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+            print(
+                f"{tables:>3} tables {bits:>2} bits   fit {elapsed:7.2f} s   "
+                f"recall@3 {recall_at(exact, approximate, 3):.3f}   score {score_ratio(exact, approximate, 3):.3f}   "
+                f"similar_to {query_ms:6.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--tables", type=int, nargs="+", default=sorted({8, 16, RECOMMENDATION_LSH_TABLES}))
+    parser.add_argument("--bits", type=int, nargs="+", default=sorted({RECOMMENDATION_LSH_BITS, 8, 12}))
+    main(parser.parse_args())
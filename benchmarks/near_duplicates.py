@@ -0,0 +1,84 @@
+'''Benchmark for the banded SimHash near-duplicate lookup
+
+Seeds a throwaway schema with --posts random fingerprints and measures
+find_near_duplicates for fingerprints 0-3 bits away from stored ones, which is the
+lookup create_post runs before inserting. Prints the query plan once to show the
+band expression indexes in use.
+
+    python -m benchmarks.near_duplicates --posts 1000000
+'''
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from social_media.auth.models import Post
+from social_media.helpers.simhash import NEAR_DUPLICATES_QUERY, SIMHASH_BANDS, band, find_near_duplicates
+
+from .schema import throwaway_schema
+
+SCHEMA = "bench_near_duplicates"
+
+
+async def seed(engine, posts):
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'author')"))
+        await conn.execute(
+            text(
+                "INSERT INTO posts (title, description, author_id, simhash) "
+                "SELECT 'Post ' || n, 'lorem ipsum', 1, "
+                "(floor(random() * 4294967296)::bigint << 32) | floor(random() * 4294967296)::bigint "
+                "FROM generate_series(1, CAST(:posts AS integer)) AS n"
+            ), {"posts": posts}
+        )
+
+    # Index-only scans need an up to date visibility map
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE posts"))
+
+
+def flip_bits(fingerprint, bits):
+    for bit in random.sample(range(64), bits):
+        fingerprint ^= 1 << bit
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+async def main(args):
+    async with throwaway_schema(SCHEMA) as (engine, session_maker):
+        await seed(engine, args.posts)
+
+        async with session_maker() as session:
+            stored = (await session.execute(select(Post.simhash).order_by(Post.id).limit(args.runs))).scalars().all()
+
+            bands = {f"band_{number}": band(stored[0], number) for number in range(SIMHASH_BANDS)}
+            compiled = NEAR_DUPLICATES_QUERY.params(bands).compile(
+                engine.sync_engine, compile_kwargs={"literal_binds": True}
+            )
+            for line in await session.execute(text(f"EXPLAIN ANALYZE {compiled}")):
+                print(line[0])
+
+            timings = []
+            found = 0
+            for fingerprint in stored:
+                probe = flip_bits(fingerprint & ((1 << 64) - 1), random.randint(0, 3))
+                start = time.perf_counter()
+                duplicates = await find_near_duplicates(session, probe)
+                timings.append((time.perf_counter() - start) * 1000)
+                found += bool(duplicates)
+
+        timings.sort()
+        print(
+            f"{args.posts} posts   p50 {statistics.median(timings):.3f} ms   "
+            f"p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms   found {found}/{len(stored)}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+'''Benchmark for /post/search on a large posts table
+
+Seeds a throwaway schema with --users authors and --posts posts, then compares the
+old search (two leading-wildcard ILIKE queries, deduplicated in Python) with one
+page of the ranked full-text and trigram query, for a rare word, a common word and
+an author name. Needs the pg_trgm extension in the configured database.
+
+    python -m benchmarks.post_search --posts 1000000 --users 10000
+'''
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import aliased, joinedload
+
+from social_media.auth.models import Post, User
+from social_media.helpers.post_search import search_posts_page
+from social_media.utils.format_post import format_posts_data
+
+from .schema import throwaway_schema
+
+SCHEMA = "bench_post_search"
+WORDS = ("cats", "dogs", "running", "databases", "cooking", "travel", "music", "football")
+QUERIES = ("quokka", "databases", "alice")
+
+
+async def seed(engine, posts, users):
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, email, name, surname, password) "
+                "SELECT i, 'user' || i, 'user' || i || '@example.com', "
+                "CASE WHEN i % 100 = 0 THEN 'Alice' ELSE 'Name' || i END, 'Surname', '' "
+                "FROM generate_series(1, CAST(:users AS integer)) AS i"
+            ), {"users": users}
+        )
+        # Every eighth post shares a common word, one in ten thousand has a rare one
+        await conn.execute(
+            text(
+                "INSERT INTO posts (title, description, author_id, created_at, updated_at) "
+                "SELECT 'Post about ' || (CAST(:words AS text[]))[1 + n % 8], "
+                "'lorem ipsum dolor ' || CASE WHEN n % 10000 = 0 THEN 'quokka' ELSE 'sit amet' END, "
+                "1 + n % CAST(:users AS integer), CURRENT_DATE, CURRENT_DATE "
+                "FROM generate_series(1, CAST(:posts AS integer)) AS n"
+            ), dict(words=list(WORDS), users=users, posts=posts)
+        )
+        await conn.execute(text("ANALYZE"))
+
+
+async def legacy_search(session, q):
+    user_alias = aliased(User)
+    posts_by_title = await session.execute(
+        select(Post).join(user_alias, user_alias.id == Post.author_id).where(Post.title.ilike(f"%{q}%")
+                                                                             ).options(joinedload(Post.author))
+    )
+    posts_by_user = await session.execute(
+        select(Post).outerjoin(user_alias, user_alias.id == Post.author_id).where(
+            or_(
+                user_alias.name.ilike(f"%{q}%"), user_alias.surname.ilike(f"%{q}%"),
+                user_alias.username.ilike(f"%{q}%")
+            )
+        ).options(joinedload(Post.author))
+    )
+    unique_posts = set()
+    found_posts = []
+    for post in posts_by_title.scalars().all() + posts_by_user.scalars().all():
+        if post.id not in unique_posts:
+            unique_posts.add(post.id)
+            found_posts.append(post)
+    return format_posts_data(found_posts)
+
+
+async def ranked_search(session, q):
+    return await search_posts_page(session, q)
+
+
+async def measure(session_maker, func, q, runs):
+    timings = []
+    for _ in range(runs):
+        async with session_maker() as session:
+            start = time.perf_counter()
+            await func(session, q)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+async def main(args):
+    async with throwaway_schema(SCHEMA) as (engine, session_maker):
+        await seed(engine, args.posts, args.users)
+        for q in QUERIES:
+            for name, func in (("before (ILIKE)", legacy_search), ("after (ranked page)", ranked_search)):
+                p50, p99 = await measure(session_maker, func, q, args.runs)
+                print(f"{q:10} {name:20} p50 {p50:9.2f} ms   p99 {p99:9.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+'''Benchmark for the random recommendations fallback
+
+Seeds a throwaway schema with growing numbers of posts (a tenth of the ids are
+deleted to leave gaps) and measures one call of the old full-scan sampler next to
+the id-probe sampler at every size. The full scan is skipped above --scan-limit posts.
+
+    python -m benchmarks.random_recommendations --sizes 1000 100000 1000000 10000000
+'''
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from social_media.auth.models import Post, User
+from social_media.helpers.random_recommends import get_random_recommendations
+from social_media.utils.format_post import serialize_author, serialize_post
+
+from .schema import throwaway_schema
+
+SCHEMA = "bench_random_recommendations"
+
+
+async def grow(engine, current, size):
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO posts (id, title, description, author_id) "
+                "SELECT n, 'Post ' || n, 'lorem ipsum', 1 "
+                "FROM generate_series(CAST(:start AS integer), CAST(:end AS integer)) AS n "
+                "WHERE n % 10 <> 0"
+            ), dict(start=current + 1, end=size)
+        )
+        await conn.execute(text("ANALYZE posts"))
+
+
+async def legacy_random_recommendations(session, post_id):
+    result = await session.execute(select(Post, User).join(User, User.id == Post.author_id).where(Post.id != post_id))
+    recommended_posts = [{**serialize_post(post), "author": serialize_author(author)} for post, author in result]
+    return random.sample(recommended_posts, min(3, len(recommended_posts)))
+
+
+async def measure(session_maker, func, size, runs):
+    timings = []
+    for _ in range(runs):
+        async with session_maker() as session:
+            start = time.perf_counter()
+            recommendations = await func(session, random.randint(1, size))
+            timings.append((time.perf_counter() - start) * 1000)
+        assert len(recommendations) == 3
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+async def main(args):
+    async with throwaway_schema(SCHEMA) as (engine, session_maker):
+        async with engine.begin() as conn:
+            await conn.execute(text("INSERT INTO users (id, username, name, surname) VALUES (1, 'author', 'A', 'B')"))
+
+        current = 0
+        for size in sorted(args.sizes):
+            await grow(engine, current, size)
+            current = size
+
+            line = f"{size:>10} posts   probes p50 {{:7.2f}} ms p99 {{:7.2f}} ms"
+            p50, p99 = await measure(session_maker, get_random_recommendations, size, args.runs)
+            line = line.format(p50, p99)
+            if size <= args.scan_limit:
+                p50, p99 = await measure(session_maker, legacy_random_recommendations, size, max(args.runs // 10, 3))
+                line += f"   full scan p50 {p50:9.2f} ms p99 {p99:9.2f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--scan-limit", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
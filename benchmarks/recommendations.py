@@ -0,0 +1,161 @@
+'''Benchmark suite for the recommendation engine
+
+Generates synthetic corpora (see benchmarks.corpus) and, for every corpus size and
+engine, reports the model fit time, the latency of similar() (precomputed
+neighbours, what the Celery tasks store for view_post) and of similar_to() (the
+on-demand path of the process pool) at p50 and p99, and the peak RSS. Every run
+happens in a fresh process so peak RSS belongs to that run alone. The database is
+left out: the serving side is a single indexed join whatever the engine.
+
+Engines:
+    legacy  TF-IDF refit plus the dense N x N linear_kernel of the old view_post
+    exact   RecommendationModel with exact sparse top-k neighbours
+    lsh     RecommendationModel with the LSH index
+
+    python -m benchmarks.recommendations --sizes 1000 10000 100000 --output results.json
+'''
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from social_media.config import RECOMMENDATION_LSH_BITS, RECOMMENDATION_LSH_TABLES
+
+from .corpus import make_corpus
+
+ENGINES = ("legacy", "exact", "lsh")
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p99_ms": timings[max(int(len(timings) * 0.99) - 1, 0)] * 1000,
+    }
+
+
+def time_queries(func, arguments):
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        func(argument)
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def run_legacy(posts, sample):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import linear_kernel
+
+    start = time.perf_counter()
+    matrix = TfidfVectorizer().fit_transform([text for _, text in posts])
+    similarity_matrix = linear_kernel(matrix, matrix)
+    fit = time.perf_counter() - start
+
+    def similar(row):
+        scores = sorted(enumerate(similarity_matrix[row]), key=lambda x: x[1], reverse=True)
+        return [index for index, _ in scores[1:4]]
+
+    return {"fit_s": fit, "similar": time_queries(similar, sample)}
+
+
+def run_model(posts, sample, lsh_tables, lsh_bits):
+    from social_media.ai.model import RecommendationModel
+
+    start = time.perf_counter()
+    model = RecommendationModel.fit(posts, lsh_tables, lsh_bits)
+    fit = time.perf_counter() - start
+
+    post_ids = [posts[row][0] for row in sample]
+    texts = [posts[row][1] for row in sample]
+    return {
+        "fit_s": fit,
+        "similar": time_queries(model.similar, post_ids),
+        "similar_to": time_queries(model.similar_to, texts),
+    }
+
+
+def run(engine, size, vocabulary, queries, lsh_tables, lsh_bits):
+    '''One engine on one corpus, in its own process'''
+    posts = make_corpus(size, vocabulary=vocabulary)
+    sample = np.random.default_rng(1).integers(0, size, size=queries).tolist()
+
+    if engine == "legacy":
+        result = run_legacy(posts, sample)
+    else:
+        result = run_model(posts, sample, lsh_tables if engine == "lsh" else 0, lsh_bits)
+
+    # ru_maxrss is in kilobytes on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "parameters": {
+            "vocabulary": args.vocabulary,
+            "queries": args.queries,
+            "lsh_tables": args.lsh_tables,
+            "lsh_bits": args.lsh_bits,
+        },
+        "results": [],
+    }
+
+    for size in args.sizes:
+        for engine in args.engines:
+            limit = {"legacy": args.legacy_limit, "exact": args.exact_limit}.get(engine)
+            if limit is not None and size > limit:
+                continue
+
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(
+                    run, engine, size, args.vocabulary, args.queries, args.lsh_tables, args.lsh_bits
+                ).result()
+            report["results"].append({"engine": engine, "posts": size, **result})
+
+            similar_to = result.get("similar_to")
+            print(
+                f"{engine:>6} {size:>7} posts   fit {result['fit_s']:8.2f} s   "
+                f"similar p50 {result['similar']['p50_ms']:8.3f} ms p99 {result['similar']['p99_ms']:8.3f} ms   " + (
+                    f"similar_to p50 {similar_to['p50_ms']:7.2f} ms p99 {similar_to['p99_ms']:7.2f} ms   "
+                    if similar_to else ""
+                ) + f"peak RSS {result['peak_rss_mb']:7.0f} MB",
+                flush=True,
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--lsh-tables", type=int, default=RECOMMENDATION_LSH_TABLES)
+    parser.add_argument("--lsh-bits", type=int, default=RECOMMENDATION_LSH_BITS)
+    # The dense matrix needs 8 * N^2 bytes, 10k posts are already 800 MB
+    parser.add_argument("--legacy-limit", type=int, default=10000)
+    parser.add_argument("--exact-limit", type=int, default=100000)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    main(parser.parse_args())
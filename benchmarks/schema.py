@@ -0,0 +1,32 @@
+'''Throwaway Postgres schema for benchmarks that need a database'''
+from contextlib import asynccontextmanager
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from social_media.auth.models import Base
+from social_media.database import DATABASE_URL
+
+
+@asynccontextmanager
+async def throwaway_schema(schema, **engine_options):
+    '''Create the app tables in a fresh schema of the configured database, dropped on exit'''
+    admin_engine = create_async_engine(DATABASE_URL)
+    async with admin_engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+    # public stays on the path for the pg_trgm operator classes and functions
+    server_settings = {"search_path": f"{schema},public"}
+    engine = create_async_engine(DATABASE_URL, connect_args={"server_settings": server_settings}, **engine_options)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        yield engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+        async with admin_engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await admin_engine.dispose()
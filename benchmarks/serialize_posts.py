@@ -0,0 +1,113 @@
+'''Microbenchmark for the post serialization path
+
+Compares the old per-row formatting (strftime and humanize on every row, then
+jsonable_encoder and json.dumps) with format_posts_data and orjson.
+
+    python -m benchmarks.serialize_posts --rows 5000 --repeat 5
+'''
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import humanize
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from social_media.utils.format_post import format_posts_data
+
+
+def make_posts(rows, days):
+    '''Build fake posts with timestamps spread over a number of distinct dates'''
+    now = datetime.utcnow()
+    authors = [SimpleNamespace(id=i, username=f"user{i}", name=f"Name{i}", surname=f"Surname{i}") for i in range(100)]
+    posts = []
+    for i in range(rows):
+        author = random.choice(authors)
+        created_at = now - timedelta(days=random.randrange(days), seconds=random.randrange(24 * 60 * 60))
+        posts.append(
+            SimpleNamespace(
+                id=i,
+                title=f"Post {i}",
+                description="lorem ipsum dolor sit amet " * 8,
+                likes=random.randrange(1000),
+                dislikes=random.randrange(100),
+                views=random.randrange(100000),
+                comment_count=random.randrange(50),
+                image=None,
+                author_id=author.id,
+                author=author,
+                created_at=created_at,
+                updated_at=created_at,
+            )
+        )
+    return posts
+
+
+def legacy_format(post):
+    '''The formatter as it was before the shared serializer'''
+    now = datetime.utcnow()
+    created_at = post.created_at
+    updated_at = post.updated_at
+    return {
+        "id": post.id,
+        "title": post.title,
+        "description": post.description,
+        "likes": post.likes,
+        "dislikes": post.dislikes,
+        "views": post.views,
+        "comments": post.comment_count,
+        "image": post.image,
+        "author_id": post.author_id,
+        "author_username": post.author.username,
+        "author_name": post.author.name,
+        "author_surname": post.author.surname,
+        "created_at": created_at.strftime("%Y-%m-%d"),
+        "created_time_ago": humanize.naturaltime(now - created_at),
+        "updated_at": updated_at.strftime("%Y-%m-%d"),
+        "updated_time_ago": humanize.naturaltime(now - updated_at),
+    }
+
+
+def legacy_path(posts):
+    payload = jsonable_encoder([legacy_format(post) for post in posts])
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(posts):
+    return orjson.dumps(format_posts_data(posts))
+
+
+def measure(func, posts, repeat):
+    '''Best rows/sec over a few runs'''
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(posts)
+        best = min(best, time.perf_counter() - start)
+    return len(posts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365, help="number of distinct post dates")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    posts = make_posts(args.rows, args.days)
+    if list(format_posts_data(posts[:1])[0]) != list(legacy_format(posts[0])):
+        raise SystemExit("format_posts_data no longer matches the legacy key order")
+
+    before = measure(legacy_path, posts, args.repeat)
+    after = measure(fast_path, posts, args.repeat)
+
+    print(f"rows: {args.rows}, distinct dates: {args.days}")
+    print(f"before: {before:,.0f} rows/sec")
+    print(f"after:  {after:,.0f} rows/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+'''Benchmark for the subscribed posts feed at 10k follows
+
+Seeds a throwaway schema in the configured Postgres database with one reader who
+follows --follows accounts, each with --posts-per-author posts. Then it compares
+the old two-step lookup (followed ids, then an unordered IN query over all their
+posts) with one page of the keyset-paginated join. The schema is dropped afterwards.
+
+    python -m benchmarks.subscribed_posts --follows 10000 --posts-per-author 5
+'''
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from social_media.auth.models import Post, Subscription
+from social_media.helpers.timeline import get_subscribed_posts_page
+
+from .schema import throwaway_schema
+
+SCHEMA = "bench_subscribed_posts"
+READER_ID = 1
+
+
+async def seed(engine, follows, posts_per_author):
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, email, name, surname, password) "
+                "SELECT i, 'user' || i, 'user' || i || '@example.com', 'Name', 'Surname', '' "
+                "FROM generate_series(1, :users) AS i"
+            ), {"users": follows + 1}
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO subscriptions (subscriber_id, subscribed_to_id) "
+                "SELECT :reader, i FROM generate_series(2, :users) AS i"
+            ), dict(reader=READER_ID, users=follows + 1)
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO posts (title, description, author_id, created_at, updated_at) "
+                "SELECT 'Post ' || n, 'lorem ipsum', 2 + n % :follows, "
+                "CURRENT_DATE - (n % 365), CURRENT_DATE - (n % 365) "
+                "FROM generate_series(1, :posts) AS n"
+            ), dict(follows=follows, posts=follows * posts_per_author)
+        )
+        await conn.execute(text("ANALYZE"))
+
+
+async def legacy_feed(session):
+    subscriptions = await session.execute(
+        select(Subscription.subscribed_to_id).where(Subscription.subscriber_id == READER_ID)
+    )
+    subscribed_user_ids = [sub[0] for sub in subscriptions]
+    posts = await session.execute(select(Post).where(Post.author_id.in_(subscribed_user_ids)))
+    return posts.scalars().all()
+
+
+async def keyset_feed(session):
+    return await get_subscribed_posts_page(session, READER_ID, limit=20)
+
+
+async def measure(session_maker, func, runs):
+    timings = []
+    for _ in range(runs):
+        async with session_maker() as session:
+            start = time.perf_counter()
+            await func(session)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+async def main(args):
+    async with throwaway_schema(SCHEMA) as (engine, session_maker):
+        await seed(engine, args.follows, args.posts_per_author)
+        for name, func in (("before (ids + IN)", legacy_feed), ("after (keyset join)", keyset_feed)):
+            p50, p99 = await measure(session_maker, func, args.runs)
+            print(f"{name:22} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--follows", type=int, default=10000)
+    parser.add_argument("--posts-per-author", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,38 @@
+"""added comment_count to post table
+
+Revision ID: 3b8f2e61c0a4
+Revises: 7c1e4a9b2d3f
+Create Date: 2026-10-18 11:03:47.918204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3b8f2e61c0a4'
+down_revision = '7c1e4a9b2d3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the counter with comments plus responses to those comments
+    op.execute(
+        """
+        UPDATE posts
+        SET comment_count = counts.total
+        FROM (
+            SELECT comments.post_id, COUNT(DISTINCT comments.id) + COUNT(comment_responses.id) AS total
+            FROM comments
+            LEFT JOIN comment_responses ON comment_responses.comment_id = comments.id
+            GROUP BY comments.post_id
+        ) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'comment_count')
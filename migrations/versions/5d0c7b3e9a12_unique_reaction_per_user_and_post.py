@@ -0,0 +1,49 @@
+"""unique reaction per user and post
+
+Revision ID: 5d0c7b3e9a12
+Revises: e52d9a07f1b6
+Create Date: 2026-10-18 15:27:52.340117
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5d0c7b3e9a12'
+down_revision = 'e52d9a07f1b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keep the oldest reaction of every (post, user) pair
+    op.execute(
+        """
+        DELETE FROM reactions
+        USING reactions AS older
+        WHERE reactions.post_id = older.post_id
+          AND reactions.user_id = older.user_id
+          AND reactions.id > older.id
+        """
+    )
+    op.create_unique_constraint('uq_reactions_post_id_user_id', 'reactions', ['post_id', 'user_id'])
+
+    # Changed reactions never moved the counters, so recount them from the reactions
+    op.execute(
+        """
+        UPDATE posts
+        SET likes = COALESCE(counts.likes, 0), dislikes = COALESCE(counts.dislikes, 0)
+        FROM posts AS p
+        LEFT JOIN (
+            SELECT post_id,
+                   COUNT(*) FILTER (WHERE reaction = 'like') AS likes,
+                   COUNT(*) FILTER (WHERE reaction = 'dislike') AS dislikes
+            FROM reactions
+            GROUP BY post_id
+        ) AS counts ON counts.post_id = p.id
+        WHERE posts.id = p.id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_reactions_post_id_user_id', 'reactions', type_='unique')
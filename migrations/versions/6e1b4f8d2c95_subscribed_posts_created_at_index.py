@@ -0,0 +1,25 @@
+"""subscribed posts created_at index
+
+Revision ID: 6e1b4f8d2c95
+Revises: a93e5b17c4d8
+Create Date: 2026-10-18 23:12:04.381527
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6e1b4f8d2c95'
+down_revision = 'a93e5b17c4d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Subscribed posts are paged by (created_at, id) again, in Redis and in Postgres alike
+    op.create_index('ix_posts_author_id_created_at_id', 'posts', ['author_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_posts_author_id_id', table_name='posts')
+
+
+def downgrade() -> None:
+    op.create_index('ix_posts_author_id_id', 'posts', ['author_id', 'id'], unique=False)
+    op.drop_index('ix_posts_author_id_created_at_id', table_name='posts')
@@ -0,0 +1,45 @@
+"""feed keyset indexes
+
+Revision ID: 7c1e4a9b2d3f
+Revises: 1824ec2c884b
+Create Date: 2026-10-18 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4a9b2d3f'
+down_revision = '1824ec2c884b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keyset pagination compares (column, id) tuples, so the sort columns must not hold NULLs
+    op.execute("UPDATE posts SET likes = 0 WHERE likes IS NULL")
+    op.execute("UPDATE posts SET dislikes = 0 WHERE dislikes IS NULL")
+    op.execute("UPDATE posts SET views = 0 WHERE views IS NULL")
+    op.execute("UPDATE posts SET created_at = COALESCE(updated_at, CURRENT_DATE) WHERE created_at IS NULL")
+
+    op.alter_column('posts', 'likes', existing_type=sa.Integer(), nullable=False, server_default='0')
+    op.alter_column('posts', 'dislikes', existing_type=sa.Integer(), nullable=False, server_default='0')
+    op.alter_column('posts', 'views', existing_type=sa.Integer(), nullable=False, server_default='0')
+    op.alter_column(
+        'posts', 'created_at', existing_type=sa.Date(), nullable=False, server_default=sa.text('CURRENT_DATE')
+    )
+
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'], unique=False)
+    op.create_index('ix_posts_likes_id', 'posts', ['likes', 'id'], unique=False)
+    op.create_index('ix_posts_views_id', 'posts', ['views', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_views_id', table_name='posts')
+    op.drop_index('ix_posts_likes_id', table_name='posts')
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
+
+    op.alter_column('posts', 'created_at', existing_type=sa.Date(), nullable=True, server_default=None)
+    op.alter_column('posts', 'views', existing_type=sa.Integer(), nullable=True, server_default=None)
+    op.alter_column('posts', 'dislikes', existing_type=sa.Integer(), nullable=True, server_default=None)
+    op.alter_column('posts', 'likes', existing_type=sa.Integer(), nullable=True, server_default=None)
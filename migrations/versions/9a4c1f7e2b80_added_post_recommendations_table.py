@@ -0,0 +1,36 @@
+"""added post recommendations table
+
+Revision ID: 9a4c1f7e2b80
+Revises: 5d0c7b3e9a12
+Create Date: 2026-10-18 16:52:18.204931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9a4c1f7e2b80'
+down_revision = '5d0c7b3e9a12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'post_recommendations',
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('recommended_post_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['recommended_post_id'], ['posts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('post_id', 'rank'),
+    )
+    op.create_index(
+        'ix_post_recommendations_recommended_post_id', 'post_recommendations', ['recommended_post_id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_recommendations_recommended_post_id', table_name='post_recommendations')
+    op.drop_table('post_recommendations')
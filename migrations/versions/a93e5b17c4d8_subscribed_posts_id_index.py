@@ -0,0 +1,25 @@
+"""subscribed posts id index
+
+Revision ID: a93e5b17c4d8
+Revises: d52c8e1f4b07
+Create Date: 2026-10-18 21:32:50.214736
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a93e5b17c4d8'
+down_revision = 'd52c8e1f4b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Subscribed posts are paged by id alone now, in Redis and in Postgres alike
+    op.create_index('ix_posts_author_id_id', 'posts', ['author_id', 'id'], unique=False)
+    op.drop_index('ix_posts_author_id_created_at_id', table_name='posts')
+
+
+def downgrade() -> None:
+    op.create_index('ix_posts_author_id_created_at_id', 'posts', ['author_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_posts_author_id_id', table_name='posts')
@@ -0,0 +1,32 @@
+"""added search outbox table
+
+Revision ID: b7e24d91c6a3
+Revises: f3a9d6c2e815
+Create Date: 2026-10-18 20:03:11.482905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b7e24d91c6a3'
+down_revision = 'f3a9d6c2e815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'search_outbox',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('available_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_search_outbox_available_at_id', 'search_outbox', ['available_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_search_outbox_available_at_id', table_name='search_outbox')
+    op.drop_table('search_outbox')
@@ -0,0 +1,34 @@
+"""added post co likes table
+
+Revision ID: c81f5e3a7d29
+Revises: 9a4c1f7e2b80
+Create Date: 2026-10-18 18:04:37.518266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5e3a7d29'
+down_revision = '9a4c1f7e2b80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'post_co_likes',
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('co_liked_post_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['co_liked_post_id'], ['posts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('post_id', 'rank'),
+    )
+    op.create_index('ix_post_co_likes_co_liked_post_id', 'post_co_likes', ['co_liked_post_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_co_likes_co_liked_post_id', table_name='post_co_likes')
+    op.drop_table('post_co_likes')
@@ -0,0 +1,45 @@
+"""added full-text and trigram search indexes
+
+Revision ID: d52c8e1f4b07
+Revises: b7e24d91c6a3
+Create Date: 2026-10-18 20:41:27.163054
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'd52c8e1f4b07'
+down_revision = 'b7e24d91c6a3'
+branch_labels = None
+depends_on = None
+
+POST_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+USER_SEARCH_FIELDS = ('name', 'surname', 'username')
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Stored generated column, adding it rewrites the posts table once
+    op.add_column(
+        'posts',
+        sa.Column(
+            'search_vector', postgresql.TSVECTOR(), sa.Computed(POST_SEARCH_VECTOR, persisted=True), nullable=True
+        )
+    )
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+    for field in USER_SEARCH_FIELDS:
+        op.create_index(
+            f'ix_users_{field}_trgm', 'users', [field], postgresql_using='gin', postgresql_ops={field: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    for field in USER_SEARCH_FIELDS:
+        op.drop_index(f'ix_users_{field}_trgm', table_name='users')
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_column('posts', 'search_vector')
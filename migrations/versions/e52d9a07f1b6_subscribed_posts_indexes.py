@@ -0,0 +1,28 @@
+"""subscribed posts indexes
+
+Revision ID: e52d9a07f1b6
+Revises: 3b8f2e61c0a4
+Create Date: 2026-10-18 13:41:09.562830
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e52d9a07f1b6'
+down_revision = '3b8f2e61c0a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_subscriptions_subscriber_id_subscribed_to_id',
+        'subscriptions', ['subscriber_id', 'subscribed_to_id'],
+        unique=False
+    )
+    op.create_index('ix_posts_author_id_created_at_id', 'posts', ['author_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_author_id_created_at_id', table_name='posts')
+    op.drop_index('ix_subscriptions_subscriber_id_subscribed_to_id', table_name='subscriptions')
@@ -0,0 +1,40 @@
+"""added simhash to post table
+
+Revision ID: f3a9d6c2e815
+Revises: c81f5e3a7d29
+Create Date: 2026-10-18 19:12:45.907316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9d6c2e815'
+down_revision = 'c81f5e3a7d29'
+branch_labels = None
+depends_on = None
+
+BAND_SHIFTS = (48, 32, 16, 0)
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('simhash', sa.BigInteger(), nullable=True))
+    op.add_column('posts', sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'posts_duplicate_of_id_fkey', 'posts', 'posts', ['duplicate_of_id'], ['id'], ondelete='SET NULL'
+    )
+    # Existing rows are fingerprinted by `make backfill-simhash`
+    for band, shift in enumerate(BAND_SHIFTS):
+        op.create_index(
+            f'ix_posts_simhash_band_{band}',
+            'posts', [sa.text(f'((simhash >> {shift}) & 65535)'), 'simhash'],
+            postgresql_include=['id']
+        )
+
+
+def downgrade() -> None:
+    for band in range(len(BAND_SHIFTS)):
+        op.drop_index(f'ix_posts_simhash_band_{band}', table_name='posts')
+    op.drop_constraint('posts_duplicate_of_id_fkey', 'posts', type_='foreignkey')
+    op.drop_column('posts', 'duplicate_of_id')
+    op.drop_column('posts', 'simhash')
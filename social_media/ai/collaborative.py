@@ -0,0 +1,76 @@
+'''Item-item collaborative filtering over post likes'''
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from social_media.auth.models import Reaction
+
+CO_LIKES_REFRESH_INTERVAL = 60 * 60
+CO_LIKES_PER_POST = 10
+# Reactions fetched per round trip while building the user x post matrix
+REACTIONS_CHUNK_SIZE = 50000
+# Posts whose similarities are computed at once, the result block stays sparse
+CO_LIKES_CHUNK_SIZE = 1024
+
+
+def load_likes(session):
+    '''Sparse binary user x post matrix of likes, with the post id of every column
+
+    Likes are streamed with a server-side cursor and only kept as two int32 arrays,
+    so memory grows with the number of likes and not with ORM rows.
+    '''
+    user_chunks, post_chunks = [], []
+    query = select(Reaction.user_id, Reaction.post_id).where(Reaction.reaction == "like")
+    likes = session.execute(query.execution_options(yield_per=REACTIONS_CHUNK_SIZE))
+    for chunk in likes.partitions():
+        user_ids, post_ids = zip(*chunk)
+        user_chunks.append(np.array(user_ids, dtype=np.int32))
+        post_chunks.append(np.array(post_ids, dtype=np.int32))
+
+    if not post_chunks:
+        return sparse.csr_matrix((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int32)
+
+    user_ids, users = np.unique(np.concatenate(user_chunks), return_inverse=True)
+    post_ids, posts = np.unique(np.concatenate(post_chunks), return_inverse=True)
+    likes = sparse.csr_matrix((np.ones(len(users), dtype=np.float32), (users, posts)),
+                              shape=(len(user_ids), len(post_ids)))
+    # One like per user and post is guaranteed by the reactions constraint
+    return likes, post_ids
+
+
+def _top_co_likes(block, start: int, k: int):
+    '''(row, rank, column, score) arrays of the best k columns of every row of a similarity block
+
+    Row r of the block is the post in column start + r, which is left out of its own row.
+    '''
+    block = block.tocoo()
+    keep = block.row + start != block.col
+    rows, columns, scores = block.row[keep], block.col[keep], block.data[keep]
+
+    # Sort by row, then by descending score, and rank within each row
+    order = np.lexsort((-scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(first, np.diff(np.r_[first, len(rows)]))
+    top = rank < k
+    return rows[top] + start, rank[top], columns[top], scores[top]
+
+
+def compute_co_likes(session, k: int = CO_LIKES_PER_POST):
+    '''(post_id, rank, co_liked_post_id, score) rows, scored by the cosine of the posts' like vectors'''
+    likes, post_ids = load_likes(session)
+    if post_ids.size == 0:
+        return []
+
+    # Columns scaled to unit length, so X^T X holds cosine similarities
+    norms = np.sqrt(np.asarray(likes.sum(axis=0)).ravel())
+    likes = (likes @ sparse.diags(1 / norms)).tocsc()
+    transposed = likes.T.tocsr()
+
+    rows = []
+    for start in range(0, len(post_ids), CO_LIKES_CHUNK_SIZE):
+        # Only posts sharing at least one user get a stored entry
+        block = transposed[start:start + CO_LIKES_CHUNK_SIZE] @ likes
+        posts, rank, co_liked, scores = _top_co_likes(block, start, k)
+        rows.extend(zip(post_ids[posts].tolist(), rank.tolist(), post_ids[co_liked].tolist(), scores.tolist()))
+
+    return rows
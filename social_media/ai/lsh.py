@@ -0,0 +1,98 @@
+'''Random-hyperplane LSH signatures for approximate cosine neighbours'''
+import numpy as np
+
+# Rows projected at once, bounds the dense projection block
+SIGN_CHUNK_SIZE = 65536
+
+
+class LSHIndex:
+    '''Packed random-hyperplane signatures of the model rows, one uint64 per table
+
+    Two vectors land in the same bucket of a table when they are on the same side of all
+    of its hyperplanes, which gets likelier the smaller their angle. More tables raise
+    recall, more bits per table shrink buckets and with them the exact re-rank work.
+    Signatures stay aligned with the model rows, the model appends and drops them.
+
+    Every table also keeps its rows sorted by signature, so the rows of a bucket are found
+    by binary search instead of a scan over all signatures. The sorted arrays are rebuilt
+    on first use after the signatures change, and saved with the model otherwise.
+    '''
+
+    def __init__(self, dimensions: int, tables: int = 8, bits: int = 16, seed: int = 0):
+        if not 1 <= bits <= 64:
+            raise ValueError("LSH signatures hold between 1 and 64 bits")
+
+        self.dimensions = dimensions
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        self.signatures = np.zeros((0, tables), dtype=np.uint64)
+        self.offsets = np.zeros(tables * bits, dtype=np.float32)
+        self._hyperplanes = None
+
+    @property
+    def signatures(self):
+        '''Signatures of the model rows, shape (rows, tables)'''
+        return self._signatures
+
+    @signatures.setter
+    def signatures(self, signatures):
+        self._signatures = signatures
+        self.buckets = None
+
+    def __getstate__(self):
+        # Hyperplanes are regenerated from the seed and buckets from the signatures instead of being persisted
+        return {**self.__dict__, "_hyperplanes": None, "buckets": None}
+
+    @property
+    def hyperplanes(self):
+        '''Random hyperplanes of all tables, one column per bit, regenerated from the seed'''
+        if self._hyperplanes is None:
+            rng = np.random.default_rng(self.seed)
+            self._hyperplanes = rng.standard_normal((self.dimensions, self.tables * self.bits), dtype=np.float32)
+        return self._hyperplanes
+
+    def center(self, matrix):
+        '''Measure sides relative to the corpus mean
+
+        TF-IDF vectors are non-negative and all crowd around the mean direction, so most
+        hyperplanes would put nearly every post on the same side. Projecting x - mean
+        instead, computed as x @ h - mean @ h to keep x sparse, spreads the buckets out.
+        '''
+        self.offsets = np.asarray(matrix.mean(axis=0) @ self.hyperplanes, dtype=np.float32).ravel()
+
+    def sign(self, vectors):
+        '''Signatures of sparse row vectors, shape (rows, tables)'''
+        weights = np.left_shift(np.uint64(1), np.arange(self.bits, dtype=np.uint64))
+        signatures = np.empty((vectors.shape[0], self.tables), dtype=np.uint64)
+
+        for start in range(0, vectors.shape[0], SIGN_CHUNK_SIZE):
+            projections = np.asarray(vectors[start:start + SIGN_CHUNK_SIZE] @ self.hyperplanes)
+            sides = (projections > self.offsets).reshape(-1, self.tables, self.bits).astype(np.uint64)
+            signatures[start:start + SIGN_CHUNK_SIZE] = (sides * weights).sum(axis=2, dtype=np.uint64)
+
+        return signatures
+
+    def sorted_buckets(self):
+        '''Rows of every table ordered by signature and the signatures in that order, shape (tables, rows) each'''
+        if self.buckets is None:
+            order = np.argsort(self.signatures, axis=0, kind="stable").T.astype(np.int32)
+            self.buckets = (order, np.take_along_axis(self.signatures.T, order, axis=1))
+        return self.buckets
+
+    def candidates(self, signature):
+        '''Rows sharing a bucket with the signature in at least one table'''
+        order, sorted_signatures = self.sorted_buckets()
+        found = [np.zeros(0, dtype=np.int32)]
+        for table in range(self.tables):
+            start = np.searchsorted(sorted_signatures[table], signature[table], side="left")
+            end = np.searchsorted(sorted_signatures[table], signature[table], side="right")
+            found.append(order[table, start:end])
+        return np.unique(np.concatenate(found))
+
+    def grouped(self, table: int):
+        '''Rows ordered by their bucket in one table, with the offset each bucket starts at'''
+        order, sorted_signatures = self.sorted_buckets()
+        column = sorted_signatures[table]
+        starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+        return order[table], starts
@@ -0,0 +1,417 @@
+'''Persistent TF-IDF model of post descriptions'''
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .lsh import LSHIndex
+from .vocabulary import Vocabulary
+
+# Neighbours kept per post, queries can ask for at most this many
+NEIGHBOURS = 10
+# Rows multiplied against the corpus (or an LSH bucket) at once while building neighbours,
+# bounds the dense scratch block to NEIGHBOUR_CHUNK_SIZE x N float32 values
+NEIGHBOUR_CHUNK_SIZE = 256
+# LSH buckets up to this size are scored pair by pair in bulk, larger ones with block products
+SMALL_BUCKET_SIZE = 32
+# Row pairs scored at once inside small LSH buckets
+PAIR_CHUNK_SIZE = 1 << 20
+# Model versions kept on disk, older ones are deleted after a new version is swapped in
+KEPT_VERSIONS = 3
+
+
+class RecommendationModel:
+    '''TF-IDF vectors of all posts and their top-k most similar posts
+
+    New and edited posts are transformed against the stored vocabulary and IDF weights,
+    so words first seen after the last fit are ignored until the next scheduled refit.
+
+    Neighbours are stored as two N x NEIGHBOURS arrays, post ids (int32, -1 padded) and
+    cosine scores (float32), best first, so memory is O(N*k) and a query is O(k).
+
+    Without an LSH index neighbours are exact. With one, only posts sharing an LSH bucket
+    are scored, exactly, so large corpora avoid the O(N^2) comparison.
+
+    Rows are kept sorted by post id, so a post's row is found by binary search and the
+    arrays can be memory-mapped as they are, see save() and load().
+    '''
+
+    def __init__(self, vocabulary: Vocabulary, post_ids, matrix, neighbours=None, scores=None, index=None):
+        self.vocabulary = vocabulary
+        self.post_ids = np.asarray(post_ids, dtype=np.int32)
+        self.matrix = sparse.csr_matrix(matrix)
+        if self.matrix.dtype != np.float32:
+            self.matrix = self.matrix.astype(np.float32)
+        self.index = index
+        self.version = None
+
+        if neighbours is None or scores is None:
+            self.neighbours = np.full((len(self.post_ids), NEIGHBOURS), -1, dtype=np.int32)
+            self.scores = np.zeros((len(self.post_ids), NEIGHBOURS), dtype=np.float32)
+            if index is None:
+                self._refresh_rows(np.arange(len(self.post_ids)))
+            else:
+                self._build_lsh_neighbours()
+        else:
+            self.neighbours = np.asarray(neighbours, dtype=np.int32)
+            self.scores = np.asarray(scores, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, posts, lsh_tables: int = 0, lsh_bits: int = 16):
+        '''Fit a new model from (post_id, description) pairs, approximate when lsh_tables is set'''
+        post_ids, texts = zip(*sorted(posts)) if posts else ((), ())
+        vectorizer = TfidfVectorizer(dtype=np.float32)
+        matrix = vectorizer.fit_transform([text or "" for text in texts])
+
+        index = None
+        if lsh_tables:
+            index = LSHIndex(matrix.shape[1], lsh_tables, lsh_bits)
+            index.center(matrix)
+            index.signatures = index.sign(matrix)
+
+        return cls(Vocabulary.from_vectorizer(vectorizer), post_ids, matrix, index=index)
+
+    def __contains__(self, post_id):
+        return self._row(post_id) is not None
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def _row(self, post_id):
+        '''Row of a post, or None when it is not in the model'''
+        row = int(np.searchsorted(self.post_ids, post_id))
+        return row if row < len(self.post_ids) and self.post_ids[row] == post_id else None
+
+    def _keep_top(self, rows, scores, candidates=None):
+        '''Store the best scored columns of each row as its neighbours
+
+        Columns are row indices unless candidates says which row every column holds.
+        Callers zero the scores of the row itself and of padding columns.
+        '''
+        self.neighbours[rows] = -1
+        self.scores[rows] = 0
+
+        k = min(NEIGHBOURS, scores.shape[1])
+        if k == 0:
+            return
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if candidates is not None:
+            top = np.take_along_axis(candidates, top, axis=1)
+
+        # Unrelated posts are not recommended
+        self.neighbours[rows, :k] = np.where(top_scores > 0, self.post_ids[top], -1)
+        self.scores[rows, :k] = np.where(top_scores > 0, top_scores, 0)
+
+    def _candidate_scores(self, vector):
+        '''Rows worth scoring against a vector and their exact scores'''
+        if self.index is None:
+            candidates = np.arange(len(self.post_ids))
+            scores = (self.matrix @ vector.T).toarray().ravel()
+        else:
+            candidates = self.index.candidates(self.index.sign(vector)[0])
+            scores = (self.matrix[candidates] @ vector.T).toarray().ravel()
+        return candidates, scores
+
+    def _refresh_rows(self, rows):
+        '''Recompute the neighbours of some rows'''
+        if self.index is not None:
+            for row in rows:
+                candidates, scores = self._candidate_scores(self.matrix[row])
+                scores[candidates == row] = 0
+                self._keep_top([row], scores[np.newaxis], candidates[np.newaxis])
+            return
+
+        transposed = self.matrix.T.tocsc()
+        for start in range(0, len(rows), NEIGHBOUR_CHUNK_SIZE):
+            chunk = rows[start:start + NEIGHBOUR_CHUNK_SIZE]
+            # Rows are L2-normalized, so the dot product is the cosine similarity
+            chunk_scores = (self.matrix[chunk] @ transposed).toarray()
+            chunk_scores[np.arange(len(chunk)), chunk] = 0
+            self._keep_top(chunk, chunk_scores)
+
+    def _pair_scores(self, rows, candidates):
+        '''Exact scores of row pairs, in chunks'''
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), PAIR_CHUNK_SIZE):
+            end = start + PAIR_CHUNK_SIZE
+            pairs = self.matrix[rows[start:end]].multiply(self.matrix[candidates[start:end]])
+            scores[start:end] = np.asarray(pairs.sum(axis=1)).ravel()
+        return scores
+
+    def _small_bucket_pairs(self, order, starts, sizes):
+        '''Scored (row, candidate) pairs of the small buckets, both ways round, with the rank of
+        each candidate among those of its row'''
+        bucket_of = np.repeat(np.arange(len(starts)), sizes)
+        small = sizes[bucket_of] <= SMALL_BUCKET_SIZE
+
+        # Every pair of sorted positions (p, p + d) inside one bucket
+        rows, candidates = [], []
+        for distance in range(1, SMALL_BUCKET_SIZE):
+            positions = np.flatnonzero(bucket_of[distance:] == bucket_of[:-distance])
+            positions = positions[small[positions]]
+            if positions.size == 0:
+                break
+            rows.append(order[positions])
+            candidates.append(order[positions + distance])
+
+        if not rows:
+            return order[:0], order[:0], np.zeros(0, dtype=np.float32), order[:0]
+
+        rows, candidates = np.concatenate(rows), np.concatenate(candidates)
+        scores = self._pair_scores(rows, candidates)
+        rows, candidates = np.r_[rows, candidates], np.r_[candidates, rows]
+        scores = np.r_[scores, scores]
+
+        by_row = np.lexsort((-scores, rows))
+        rows, candidates, scores = rows[by_row], candidates[by_row], scores[by_row]
+        first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        rank = np.arange(len(rows)) - np.repeat(first, np.diff(np.r_[first, len(rows)]))
+        return rows, candidates, scores, rank
+
+    def _large_bucket_neighbours(self, members, found, found_scores):
+        '''Top neighbours of the rows of one large bucket, from chunked block products like the exact path'''
+        transposed = self.matrix[members].T.tocsc()
+        k = min(NEIGHBOURS, len(members))
+        for start in range(0, len(members), NEIGHBOUR_CHUNK_SIZE):
+            chunk = members[start:start + NEIGHBOUR_CHUNK_SIZE]
+            block = (self.matrix[chunk] @ transposed).toarray()
+            block[np.arange(len(chunk)), np.arange(start, start + len(chunk))] = 0
+
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            found[chunk, :k] = members[top]
+            found_scores[chunk, :k] = np.take_along_axis(block, top, axis=1)
+
+    def _bucket_neighbours(self, table):
+        '''Top neighbours of every row among the rows sharing its bucket in one table'''
+        size = len(self.post_ids)
+        found = np.full((size, NEIGHBOURS), -1, dtype=np.int64)
+        found_scores = np.zeros((size, NEIGHBOURS), dtype=np.float32)
+
+        order, starts = self.index.grouped(table)
+        sizes = np.diff(np.r_[starts, size])
+
+        # Small buckets are scored pairwise
+        rows, candidates, scores, rank = self._small_bucket_pairs(order, starts, sizes)
+        keep = rank < NEIGHBOURS
+        found[rows[keep], rank[keep]] = candidates[keep]
+        found_scores[rows[keep], rank[keep]] = scores[keep]
+
+        for bucket in np.flatnonzero(sizes > SMALL_BUCKET_SIZE):
+            self._large_bucket_neighbours(order[starts[bucket]:starts[bucket] + sizes[bucket]], found, found_scores)
+
+        return found, found_scores
+
+    def _build_lsh_neighbours(self):
+        '''Neighbours of all rows from exact scores within every LSH bucket'''
+        size = len(self.post_ids)
+        # Best candidates so far as row indices, -1 padded, merged table by table
+        best = np.full((size, NEIGHBOURS), -1, dtype=np.int64)
+        best_scores = np.zeros((size, NEIGHBOURS), dtype=np.float32)
+
+        for table in range(self.index.tables):
+            found, found_scores = self._bucket_neighbours(table)
+            candidates = np.hstack([best, found])
+            scores = np.hstack([best_scores, found_scores])
+
+            # The same pair turns up in several tables, keep it once
+            order = np.argsort(candidates, axis=1, kind="stable")
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+            duplicate = np.zeros(candidates.shape, dtype=bool)
+            duplicate[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+            scores[duplicate | (candidates < 0)] = 0
+
+            top = np.argpartition(-scores, NEIGHBOURS - 1, axis=1)[:, :NEIGHBOURS]
+            best = np.take_along_axis(candidates, top, axis=1)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+
+        self._keep_top(np.arange(size), best_scores, best)
+
+    def update(self, posts, removed_ids=()):
+        '''Add or replace (post_id, text) pairs and drop deleted posts in one pass over the arrays,
+        returns the posts whose neighbours were updated'''
+        posts = sorted(posts)
+        changed_ids = np.asarray([post_id for post_id, _ in posts], dtype=np.int32)
+        gone = np.union1d(np.asarray(list(removed_ids), dtype=np.int32), changed_ids)
+        if posts:
+            vectors = self.vocabulary.transform([text for _, text in posts])
+        else:
+            vectors = sparse.csr_matrix((0, self.matrix.shape[1]), dtype=np.float32)
+
+        # Changed rows are dropped and appended again, then everything is put back in post id order
+        keep = ~np.isin(self.post_ids, gone)
+        post_ids = np.concatenate([self.post_ids[keep], changed_ids])
+        order = np.argsort(post_ids, kind="stable")
+        if self.index is not None:
+            signatures = self.index.sign(vectors) if posts else self.index.signatures[:0]
+            self.index.signatures = np.concatenate([self.index.signatures[keep], signatures])[order]
+        self.__init__(
+            self.vocabulary,
+            post_ids[order],
+            sparse.vstack([self.matrix[keep], vectors], format="csr")[order],
+            np.vstack([self.neighbours[keep], np.full((len(posts), NEIGHBOURS), -1, np.int32)])[order],
+            np.vstack([self.scores[keep], np.zeros((len(posts), NEIGHBOURS), np.float32)])[order],
+            self.index,
+        )
+
+        # Posts that listed a removed or old vector, the changed posts, and posts a new vector now makes it into
+        affected = np.isin(self.neighbours, gone).any(axis=1)
+        affected[np.searchsorted(self.post_ids, changed_ids)] = True
+        for vector in vectors:
+            candidates, scores = self._candidate_scores(vector)
+            affected[candidates[scores > self.scores[candidates, -1]]] = True
+
+        rows = np.flatnonzero(affected)
+        self._refresh_rows(rows)
+        return self.post_ids[rows].tolist()
+
+    def upsert(self, post_id: int, text: str):
+        '''Add or replace the vector of one post, returns the posts whose neighbours were updated'''
+        return self.update([(post_id, text)])
+
+    def remove(self, post_id: int):
+        '''Drop the vector of a deleted post, returns the posts whose neighbours were refilled'''
+        return self.update([], [post_id])
+
+    def similar(self, post_id: int, k: int = 3):
+        '''Ids of the k posts most similar to the given one, best first'''
+        row = self._row(post_id)
+        if row is None:
+            return []
+
+        neighbours = self.neighbours[row, :k]
+        return neighbours[neighbours >= 0].tolist()
+
+    def similar_to(self, text: str, k: int = 3, exclude: int = None):
+        '''Ids of the k posts most similar to an arbitrary text, for posts not in the model yet'''
+        candidates, scores = self._candidate_scores(self.vocabulary.transform([text]))
+        excluded_row = self._row(exclude) if exclude is not None else None
+        if excluded_row is not None:
+            scores[candidates == excluded_row] = 0
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return self.post_ids[candidates[top[scores[top] > 0]]].tolist()
+
+    def recommendation_rows(self, post_ids=None):
+        '''(post_id, rank, recommended_post_id, score) rows of some posts, or of all of them'''
+        if post_ids is None:
+            rows = range(len(self.post_ids))
+        else:
+            rows = [row for row in map(self._row, post_ids) if row is not None]
+
+        for row in rows:
+            post_id = int(self.post_ids[row])
+            for rank, (neighbour, score) in enumerate(zip(self.neighbours[row].tolist(), self.scores[row].tolist())):
+                if neighbour < 0:
+                    break
+                yield post_id, rank, neighbour, score
+
+    def save(self, path: str):
+        '''Write the model as a new version of flat .npy files and atomically make it the current one
+
+        The path is a directory holding versions/<version>/ and a `current` symlink. Readers
+        follow the symlink once per load, so they see either the old or the new version.
+        '''
+        versions = os.path.join(path, "versions")
+        os.makedirs(versions, exist_ok=True)
+        version = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+
+        arrays = {
+            "post_ids": self.post_ids,
+            "neighbours": self.neighbours,
+            "scores": self.scores,
+            "matrix_data": self.matrix.data,
+            "matrix_indices": self.matrix.indices,
+            "matrix_indptr": self.matrix.indptr,
+            "terms": self.vocabulary.terms,
+            "idf": self.vocabulary.idf,
+        }
+        meta = {"shape": list(self.matrix.shape), "lsh": None}
+        if self.index is not None:
+            arrays["lsh_signatures"] = self.index.signatures
+            arrays["lsh_offsets"] = self.index.offsets
+            arrays["lsh_order"], arrays["lsh_sorted_signatures"] = self.index.sorted_buckets()
+            meta["lsh"] = {"tables": self.index.tables, "bits": self.index.bits, "seed": self.index.seed}
+
+        directory = tempfile.mkdtemp(dir=versions, prefix=".tmp-")
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+            with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            os.rename(directory, os.path.join(versions, version))
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        # rename() over an existing symlink replaces it atomically
+        link = os.path.join(path, f".current-{version}")
+        os.symlink(os.path.join("versions", version), link)
+        os.replace(link, os.path.join(path, "current"))
+        self.version = version
+
+        # Processes still mapping a deleted version keep reading it until they reload
+        for old_version in sorted(os.listdir(versions))[:-KEPT_VERSIONS]:
+            if not old_version.startswith("."):
+                shutil.rmtree(os.path.join(versions, old_version), ignore_errors=True)
+
+    @staticmethod
+    def current_version(path: str):
+        '''Version the `current` symlink points at, or None before the first save'''
+        try:
+            return os.path.basename(os.readlink(os.path.join(path, "current")))
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        '''Open the current version, memory-mapped and read-only unless mmap is False
+
+        Memory-mapped arrays live in the page cache, so every process serving the same
+        version shares one copy. Models that will be updated are loaded with mmap=False.
+        '''
+        version = cls.current_version(path)
+        if version is None:
+            raise FileNotFoundError(f"No recommendation model in {path}")
+
+        directory = os.path.join(path, "versions", version)
+        mmap_mode = "r" if mmap else None
+
+        def array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        # Terms are looked up in the mapped array, no process builds its own term dict
+        vocabulary = Vocabulary(array("terms"), array("idf"))
+
+        matrix = sparse.csr_matrix((array("matrix_data"), array("matrix_indices"), array("matrix_indptr")),
+                                   shape=tuple(meta["shape"]))
+
+        index = None
+        if meta["lsh"]:
+            index = LSHIndex(meta["shape"][1], meta["lsh"]["tables"], meta["lsh"]["bits"], meta["lsh"]["seed"])
+            index.signatures = array("lsh_signatures")
+            index.offsets = array("lsh_offsets")
+            index.buckets = (array("lsh_order"), array("lsh_sorted_signatures"))
+
+        model = cls(vocabulary, array("post_ids"), matrix, array("neighbours"), array("scores"), index)
+        model.version = version
+        return model
@@ -0,0 +1,82 @@
+'''Process pool for recommendation work that must not run on the event loop'''
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from social_media.config import (
+    RECOMMENDATION_MODEL_PATH, RECOMMENDATION_QUEUE_DEPTH, RECOMMENDATION_TIMEOUT, RECOMMENDATION_WORKERS
+)
+from .model import RecommendationModel
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_slots = None
+
+# Memory-mapped model of this pool process, reopened when the Celery tasks swap in a new version
+_model = None
+
+
+def _load_model():
+    '''The current model version, or None before the first fit'''
+    global _model  # pylint: disable=global-statement
+
+    version = RecommendationModel.current_version(RECOMMENDATION_MODEL_PATH)
+    if version is None:
+        return None
+
+    if _model is None or _model.version != version:
+        _model = RecommendationModel.load(RECOMMENDATION_MODEL_PATH)
+
+    return _model
+
+
+def _similar_post_ids(post_id, text, count):
+    '''Runs in a pool process'''
+    model = _load_model()
+    if model is None:
+        return []
+    if post_id in model:
+        return model.similar(post_id, count)
+    return model.similar_to(text, count, exclude=post_id)
+
+
+def get_executor():
+    '''The process pool of this worker, created with its queue slots on first use'''
+    global _executor, _slots  # pylint: disable=global-statement
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RECOMMENDATION_WORKERS)
+        _slots = asyncio.Semaphore(RECOMMENDATION_QUEUE_DEPTH)
+    return _executor
+
+
+def shutdown_executor():
+    '''Stop the pool on application shutdown, dropping queued work'''
+    global _executor  # pylint: disable=global-statement
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def compute_similar_post_ids(post_id: int, text: str, count: int):
+    '''Similar post ids computed in the pool, or None when the pool is saturated or too slow'''
+    executor = get_executor()
+    if _slots.locked():
+        # Queue is full, do not pile more work on it
+        return None
+
+    await _slots.acquire()
+    future = asyncio.get_running_loop().run_in_executor(executor, _similar_post_ids, post_id, text, count)
+    # The slot is held until the process finishes, not until the request gives up on it
+    future.add_done_callback(lambda _: _slots.release())
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), RECOMMENDATION_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Recommendations for post %s timed out after %ss", post_id, RECOMMENDATION_TIMEOUT)
+        return None
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Recommendations for post %s failed: %s", post_id, exc)
+        return None
@@ -1,49 +1,59 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+'''Similar posts served from the precomputed post_recommendations table'''
+import logging
+
+from redis.exceptions import RedisError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from social_media.auth.models import Post
+from social_media.auth.models import Post, PostRecommendation, User
+from social_media.cache import redis_client
 from social_media.helpers.random_recommends import get_random_recommendations
-
-
-async def get_similarity_matrix(session: AsyncSession):
-    '''Calculates similarity matrix between posts based on keywords'''
-
-    posts = await session.execute(select(Post))
-    all_posts = posts.scalars().all()
-
-    # Extract keywords from posts
-    post_keywords = [post.description for post in all_posts]
-
-    # Create TF-IDF vectorizer
-    tfidf_vectorizer = TfidfVectorizer()
-    tfidf_matrix = tfidf_vectorizer.fit_transform(post_keywords)
-
-    # Calculate cosine similarity matrix
-    cosine_sim = linear_kernel(tfidf_matrix, tfidf_matrix)
-
-    return cosine_sim
-
-
-async def get_similar_posts(session: AsyncSession, post_id: int, similarity_matrix):
-    '''Get similar posts based on similarity matrix'''
-
-    post_index = post_id - 1
-
-    if 0 <= post_index < len(similarity_matrix):
-        similar_scores = list(enumerate(similarity_matrix[post_index]))
-
-        # Sort posts by similarity score in descending order
-        sorted_similar_scores = sorted(similar_scores, key=lambda x: x[1], reverse=True)
-
-        # Exclude the current post and get top recommendations
-        top_recommendations = []
-        for post_index, _ in sorted_similar_scores[1:4]:
-            post = await session.get(Post, post_index + 1)
-            if post:
-                top_recommendations.append(post)
-
-        return top_recommendations
-    else:
-        random_recommendations = await get_random_recommendations(session, post_id)
-        return random_recommendations
+from social_media.utils.format_post import serialize_author, serialize_post
+from .pool import compute_similar_post_ids
+
+logger = logging.getLogger(__name__)
+
+# Full refit from Postgres, in between posts are added to the model incrementally
+RECOMMENDATION_REFIT_INTERVAL = 6 * 60 * 60
+# Changed posts are collected in a Redis set and applied to the model in one batch per interval
+RECOMMENDATION_UPDATE_INTERVAL = 60
+CHANGED_POSTS_KEY = "recommendations:changed"
+# Posts being applied by the update task
+UPDATING_POSTS_KEY = "recommendations:updating"
+# Serializes writers of the model file across Celery workers
+RECOMMENDATION_MODEL_LOCK = "recommendations:model-lock"
+RECOMMENDATIONS_PER_POST = 3
+
+
+async def mark_post_changed(post_id: int):
+    '''Queue a created, edited or deleted post for the next batched model update'''
+    try:
+        await redis_client.sadd(CHANGED_POSTS_KEY, post_id)
+    except RedisError as exc:
+        # The post is still picked up by the next full refit
+        logger.warning("Could not queue post %s for the recommendation model: %s", post_id, exc)
+
+
+async def get_similar_posts(session: AsyncSession, post: Post, limit: int = RECOMMENDATIONS_PER_POST):
+    '''Get similar posts with their authors in one query'''
+    query = select(Post, User).join(User, User.id == Post.author_id)
+
+    stored = query.join(PostRecommendation, Post.id == PostRecommendation.recommended_post_id)
+    result = await session.execute(
+        stored.where(PostRecommendation.post_id == post.id).order_by(PostRecommendation.rank).limit(limit)
+    )
+    recommendations = [{**serialize_post(similar), "author": serialize_author(author)} for similar, author in result]
+    if recommendations:
+        return recommendations
+
+    # Post not processed by the recommendation tasks yet, score it against the model off the event loop
+    similar_ids = await compute_similar_post_ids(post.id, post.description, limit)
+    if not similar_ids:
+        return await get_random_recommendations(session, post.id, limit)
+
+    result = await session.execute(query.where(Post.id.in_(similar_ids)))
+    recommended_posts = {
+        similar.id: {
+            **serialize_post(similar), "author": serialize_author(author)
+        } for similar, author in result
+    }
+    return [recommended_posts[similar_id] for similar_id in similar_ids if similar_id in recommended_posts]
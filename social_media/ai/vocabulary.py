@@ -0,0 +1,52 @@
+'''Fitted TF-IDF vocabulary kept as flat arrays'''
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+class Vocabulary:
+    '''Terms and IDF weights of a fitted TfidfVectorizer, without its per-process term dict
+
+    Terms are a sorted array of fixed-width UTF-8 bytes, so the column of a term is found
+    by binary search and the array can be memory-mapped like the other model arrays.
+    UTF-8 bytes sort like the strings they encode, which keeps the column order of the
+    vectorizer, whose fitted vocabulary is sorted too.
+    '''
+
+    def __init__(self, terms, idf):
+        self.terms = terms
+        self.idf = idf
+        # Same tokenization as the vectorizer the terms were fitted with
+        self.analyzer = TfidfVectorizer().build_analyzer()
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer: TfidfVectorizer):
+        '''Vocabulary of a fitted vectorizer'''
+        terms = [term.encode("utf-8") for term in vectorizer.get_feature_names_out()]
+        return cls(np.array(terms, dtype=bytes) if terms else np.zeros(0, dtype="S1"), vectorizer.idf_)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def transform(self, texts):
+        '''L2-normalized TF-IDF rows of some texts, terms outside the vocabulary are ignored'''
+        rows, columns = [], []
+        for row, text in enumerate(texts):
+            tokens = [token.encode("utf-8") for token in self.analyzer(text or "")]
+            if not tokens or not len(self.terms):
+                continue
+
+            tokens = np.array(tokens, dtype=bytes)
+            found = np.minimum(np.searchsorted(self.terms, tokens), len(self.terms) - 1)
+            found = found[self.terms[found] == tokens]
+            rows.append(np.full(len(found), row))
+            columns.append(found)
+
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+        # Repeated terms are summed into counts
+        counts = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                                   shape=(len(texts), len(self.terms)))
+        weighted = sparse.csr_matrix(counts.multiply(np.asarray(self.idf, dtype=np.float32)), dtype=np.float32)
+        return normalize(weighted, copy=False)
@@ -1,11 +1,21 @@
 '''Necessary SQLAlchemy modules'''
 from datetime import datetime
-from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, String, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    BigInteger, Column, Computed, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint,
+    func, literal_column
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Weighted lexemes of a post for full-text search, titles rank above descriptions
+POST_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
 
 class User(Base):
     '''User Table'''
@@ -24,6 +34,12 @@ class User(Base):
     comments = relationship("Comment", back_populates="user")
     comment_responses = relationship("CommentResponse", back_populates="user")
 
+    # Trigram indexes serving the substring author search of /post/search
+    __table_args__ = tuple(
+        Index(f"ix_users_{field}_trgm", field, postgresql_using="gin", postgresql_ops={field: "gin_trgm_ops"})
+        for field in ("name", "surname", "username")
+    )
+
 
 class Post(Base):
     '''Post Table'''
@@ -32,18 +48,44 @@ class Post(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     description = Column(Text)
-    likes = Column(Integer, default=0)
-    dislikes = Column(Integer, default=0)
-    views = Column(Integer, default=0)
+    likes = Column(Integer, default=0, server_default="0", nullable=False)
+    dislikes = Column(Integer, default=0, server_default="0", nullable=False)
+    views = Column(Integer, default=0, server_default="0", nullable=False)
+    comment_count = Column(Integer, default=0, server_default="0", nullable=False)
     image = Column(String, nullable=True)
-    created_at = Column(Date, default=datetime.utcnow)
+    created_at = Column(Date, default=datetime.utcnow, server_default=func.current_date(), nullable=False)
     updated_at = Column(Date, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id = Column(Integer, ForeignKey("users.id"))
+    # 64-bit SimHash of title and description, see helpers/simhash.py
+    simhash = Column(BigInteger, nullable=True)
+    # Earlier post this one was flagged as a near-duplicate of
+    duplicate_of_id = Column(Integer, ForeignKey("posts.id", ondelete="SET NULL"), nullable=True)
+    # Generated by Postgres and only read by search, so it is left out of regular loads
+    search_vector = deferred(Column(TSVECTOR, Computed(POST_SEARCH_VECTOR, persisted=True)))
 
     author = relationship("User", back_populates="posts")
     reactions = relationship("Reaction", back_populates="post")
     comments = relationship("Comment", back_populates="post")
 
+    # Composite indexes backing the keyset-paginated feeds
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_likes_id", "likes", "id"),
+        Index("ix_posts_views_id", "views", "id"),
+        Index("ix_posts_author_id_created_at_id", "author_id", "created_at", "id"),
+        # One expression index per 16-bit SimHash band, kept in sync with helpers/simhash.band.
+        # They cover simhash and id, so band lookups are index-only scans.
+        *(
+            Index(
+                f"ix_posts_simhash_band_{band}",
+                literal_column(f"((simhash >> {shift}) & 65535)"),
+                "simhash",
+                postgresql_include=["id"],
+            ) for band, shift in enumerate((48, 32, 16, 0))
+        ),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
 
 class Reaction(Base):
     '''Reaction Table to store likes and dislikes'''
@@ -57,6 +99,9 @@ class Reaction(Base):
     post = relationship("Post", back_populates="reactions")
     user = relationship("User", back_populates="reactions")
 
+    # One reaction per user and post, the target of the reaction upsert
+    __table_args__ = (UniqueConstraint("post_id", "user_id", name="uq_reactions_post_id_user_id"),)
+
 
 class Comment(Base):
     '''Comment table to store them'''
@@ -97,3 +142,42 @@ class Subscription(Base):
 
     subscriber = relationship("User", foreign_keys=[subscriber_id])
     subscribed_to = relationship("User", foreign_keys=[subscribed_to_id])
+
+    __table_args__ = (Index("ix_subscriptions_subscriber_id_subscribed_to_id", "subscriber_id", "subscribed_to_id"),)
+
+
+class PostRecommendation(Base):
+    '''Precomputed similar posts, rewritten by the recommendation Celery tasks'''
+    __tablename__ = "post_recommendations"
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    recommended_post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_post_recommendations_recommended_post_id", "recommended_post_id"),)
+
+
+class PostCoLike(Base):
+    '''Posts liked by the same users, rewritten by the refresh_co_likes Celery task'''
+    __tablename__ = "post_co_likes"
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    co_liked_post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_post_co_likes_co_liked_post_id", "co_liked_post_id"),)
+
+
+class SearchOutbox(Base):
+    '''Posts changed since they were last sent to the search index, drained by the drain_search_outbox Celery task'''
+    __tablename__ = "search_outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    # No foreign key, the row has to outlive a deleted post so the deletion reaches the index
+    post_id = Column(Integer, nullable=False)
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    available_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_search_outbox_available_at_id", "available_at", "id"),)
@@ -1,11 +1,12 @@
 '''Handling Authentication'''
 import bcrypt
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy import select
 from sqlalchemy.exc import NoResultFound
 from social_media.database import async_session_maker
 from social_media.helpers.auth_user import get_authenticated_user
+from social_media.helpers.streaming import stream_ndjson, wants_ndjson
 from .models import User
 from .schemas import UserSignup, UserLogin, UserUpdate
 
@@ -129,22 +130,20 @@ async def update_user(user_id: int, user_update: UserUpdate, token: str = Depend
     return UserUpdate(id=user.id, username=user.username, email=user.email, name=user.name, surname=user.surname)
 
 
+def format_user(user: User) -> dict:
+    '''Public user fields'''
+    return {"id": user.id, "username": user.username, "email": user.email, "name": user.name, "surname": user.surname}
+
+
 @router.get("/users/")
-async def get_all_users():
-    '''Get all users (GET)'''
+async def get_all_users(request: Request):
+    '''Get all users (GET), streamed with Accept: application/x-ndjson'''
+    if wants_ndjson(request):
+        return stream_ndjson(select(User).order_by(User.id), format_user)
+
     async with async_session_maker() as session:
         users = await session.execute(select(User))
         all_users = users.scalars().all()
 
     # Extract the user data
-    formatted_users = []
-    for user in all_users:
-        formatted_users.append({
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "name": user.name,
-            "surname": user.surname
-        })
-
-    return formatted_users
+    return [format_user(user) for user in all_users]
@@ -0,0 +1,11 @@
+'''Redis connections shared by the API and the Celery workers'''
+import redis
+from redis import asyncio as aioredis
+
+from .config import REDIS_HOST, REDIS_PORT
+
+# The clients keep their own connection pools, so one instance per process is enough
+redis_client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+
+# Blocking client for Celery tasks
+sync_redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
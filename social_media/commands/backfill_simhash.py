@@ -0,0 +1,45 @@
+'''Fingerprint existing posts that have no SimHash yet
+
+    python -m social_media.commands.backfill_simhash [--batch-size 5000]
+
+Walks the posts table in primary key order, one batch per transaction, so it can be
+stopped and rerun at any time and never holds long locks.
+'''
+import argparse
+import time
+
+from sqlalchemy import BigInteger, Integer, column, select, update, values
+from social_media.auth.models import Post
+from social_media.database import sync_session_maker
+from social_media.helpers.simhash import simhash
+
+
+def backfill(batch_size):
+    '''Fingerprint posts without a SimHash, batch_size posts per transaction'''
+    last_id = 0
+    total = 0
+    started = time.monotonic()
+
+    while True:
+        with sync_session_maker() as session:
+            query = select(Post.id, Post.title, Post.description).where(Post.id > last_id, Post.simhash.is_(None))
+            posts = session.execute(query.order_by(Post.id).limit(batch_size)).all()
+            if not posts:
+                break
+
+            rows = [(post_id, simhash(title, description)) for post_id, title, description in posts]
+            fingerprints = values(column("id", Integer), column("simhash", BigInteger), name="fingerprints").data(rows)
+            session.execute(update(Post).where(Post.id == fingerprints.c.id).values(simhash=fingerprints.c.simhash))
+            session.commit()
+
+        last_id = posts[-1].id
+        total += len(posts)
+        print(f"{total} posts fingerprinted, up to id {last_id} ({time.monotonic() - started:.1f} s)", flush=True)
+
+    print(f"Done, {total} posts fingerprinted")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    backfill(parser.parse_args().batch_size)
@@ -0,0 +1,159 @@
+'''Rebuild the posts search index from Postgres without search downtime
+
+    python -m social_media.commands.reindex_posts [--batch-size 1000] [--parallelism 4] [--keep 2]
+
+Posts are streamed through a server-side cursor into a new versioned index
+(posts_<timestamp>) with parallel bulk requests. Once it is complete, the `posts`
+alias is moved to it in one atomic update_aliases call, so searches switch from the
+old index to the new one at once.
+
+Posts created, edited or deleted while the build runs are recorded by the outbox
+drain (see elastic/outbox.py) and replayed from their current state into the new
+index, once before the swap and once after it for changes that raced the swap.
+'''
+import argparse
+import time
+from datetime import datetime
+
+from opensearchpy.helpers import bulk, parallel_bulk
+from sqlalchemy import select
+from social_media.auth.models import Post
+from social_media.cache import sync_redis_client
+from social_media.database import sync_session_maker
+from social_media.elastic.client import sync_client
+from social_media.elastic.outbox import REINDEX_CHANGES_KEY, REINDEX_KEY, failed_post_ids, index_actions
+from social_media.elastic.search import POSTS_INDEX, post_document
+
+POSTS_MAPPINGS = {
+    "properties": {
+        "id": {
+            "type": "integer"
+        },
+        "title": {
+            "type": "text"
+        },
+        "description": {
+            "type": "text"
+        }
+    }
+}
+# Lifetime of the reindex marker, refreshed while the build makes progress
+REINDEX_MARKER_TTL = 10 * 60
+
+
+def mark_reindex():
+    '''Flag a running build, so outbox drains record the posts they index for the replay'''
+    sync_redis_client.set(REINDEX_KEY, 1, ex=REINDEX_MARKER_TTL)
+    sync_redis_client.expire(REINDEX_CHANGES_KEY, REINDEX_MARKER_TTL)
+
+
+def post_actions(index, batch_size):
+    '''Bulk actions for every post, streamed from a server-side cursor'''
+    with sync_session_maker() as session:
+        query = select(Post.id, Post.title, Post.description).order_by(Post.id)
+        posts = session.execute(query.execution_options(yield_per=batch_size))
+        for post in posts:
+            yield {"_index": index, "_id": post.id, "_source": post_document(post)}
+
+
+def replay_changes(client, index, batch_size):
+    '''Send the current state of every post changed during the build to the new index'''
+    replayed = 0
+    while True:
+        post_ids = sync_redis_client.spop(REINDEX_CHANGES_KEY, batch_size)
+        if not post_ids:
+            return replayed
+
+        with sync_session_maker() as session:
+            actions = index_actions(session, sorted(int(post_id) for post_id in post_ids), index)
+        _, errors = bulk(client, actions, raise_on_error=False)
+        for post_id in failed_post_ids(errors):
+            print(f"Failed to replay post {post_id}")
+        replayed += len(post_ids)
+        mark_reindex()
+
+
+def send(client, actions, batch_size, parallelism, progress):
+    '''Index actions with parallel bulk requests, counting results into progress'''
+    started = time.monotonic()
+    for ok, item in parallel_bulk(
+        client, actions, thread_count=parallelism, chunk_size=batch_size, raise_on_error=False
+    ):
+        if ok:
+            progress["indexed"] += 1
+        else:
+            progress["failed"] += 1
+            print(f"Failed: {item}")
+
+        done = progress["indexed"] + progress["failed"]
+        if done % (batch_size * 10) == 0:
+            elapsed = time.monotonic() - started
+            print(f"{done} posts sent, {done / elapsed:.0f} docs/s", flush=True)
+            mark_reindex()
+
+
+def current_replicas(client):
+    '''Replica count of the index behind the alias, None when there is none yet'''
+    if not client.indices.exists(index=POSTS_INDEX):
+        return None
+    settings = client.indices.get_settings(index=POSTS_INDEX, name="index.number_of_replicas")
+    return next(iter(settings.values()))["settings"]["index"]["number_of_replicas"]
+
+
+def reindex(batch_size, parallelism, keep):
+    '''Build a new posts index, then move the alias to it and drop old builds beyond keep'''
+    client = sync_client(timeout=120)
+    index = f"{POSTS_INDEX}_{datetime.utcnow():%Y%m%d%H%M%S}"
+    replicas = current_replicas(client)
+
+    # No refreshes or replicas while building, both are restored before the swap
+    settings = {"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+    client.indices.create(index=index, body={"settings": settings, "mappings": POSTS_MAPPINGS})
+
+    # Changes drained from here on are recorded, the snapshot streamed below may miss them
+    sync_redis_client.delete(REINDEX_CHANGES_KEY)
+    mark_reindex()
+
+    progress = {"indexed": 0, "failed": 0}
+    started = time.monotonic()
+    send(client, post_actions(index, batch_size), batch_size, parallelism, progress)
+    elapsed = time.monotonic() - started
+    print(
+        f"Built {index}: {progress['indexed']} posts in {elapsed:.1f} s "
+        f"({progress['indexed'] / max(elapsed, 1e-9):.0f} docs/s), {progress['failed']} failed"
+    )
+
+    print(f"Replayed {replay_changes(client, index, batch_size)} posts changed during the build")
+
+    # The old replica count is kept, a null resets it to the cluster default for a first build
+    settings = {"index": {"refresh_interval": "1s", "number_of_replicas": replicas}}
+    client.indices.put_settings(index=index, body=settings)
+    client.indices.refresh(index=index)
+
+    # Move the alias in one call, a concrete index still called `posts` is dropped in the same step
+    actions = [{"add": {"index": index, "alias": POSTS_INDEX}}]
+    if client.indices.exists_alias(name=POSTS_INDEX):
+        actions.insert(0, {"remove": {"index": "*", "alias": POSTS_INDEX}})
+    elif client.indices.exists(index=POSTS_INDEX):
+        actions.insert(0, {"remove_index": {"index": POSTS_INDEX}})
+    client.indices.update_aliases(body={"actions": actions})
+    print(f"Alias {POSTS_INDEX} now points to {index}")
+
+    # Drains that started before the swap may still have written to the old index
+    print(f"Replayed {replay_changes(client, index, batch_size)} posts changed during the swap")
+    sync_redis_client.delete(REINDEX_KEY)
+    replay_changes(client, index, batch_size)
+
+    versions = sorted(client.indices.get(index=f"{POSTS_INDEX}_*"))
+    for old_index in versions[:-keep]:
+        client.indices.delete(index=old_index)
+        print(f"Deleted {old_index}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--keep", type=int, default=2, help="versioned indexes kept, including the new one")
+    args = parser.parse_args()
+    reindex(args.batch_size, args.parallelism, args.keep)
@@ -1,15 +1,17 @@
 '''Handling Comment Section'''
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, update
 
 from social_media.auth.models import Comment, CommentResponse, Post, User
 from social_media.auth.jwt.jwt_bearer import JwtBearer
 from social_media.database import async_session_maker
 from social_media.helpers.auth_user import get_authenticated_user
+from social_media.helpers.feed_cache import invalidate_feeds
 
 from .schemas import CommentCreate, CommentResponseCreate
 
-router = APIRouter(prefix="/comment", tags=["Comment"])
+router = APIRouter(prefix="/comment", tags=["Comment"], default_response_class=ORJSONResponse)
 
 
 @router.post("/comments", dependencies=[Depends(JwtBearer())])
@@ -27,10 +29,14 @@ async def create_comment(post_id: int, comment: CommentCreate, token: str = Depe
 
         new_comment = Comment(text=comment.text, user_id=user_obj.id, post_id=post_id)
 
-        # Add the comment to the session and commit the changes
+        # Add the comment and bump the post's comment counter in the same transaction
         session.add(new_comment)
+        await session.execute(update(Post).where(Post.id == post_id).values(comment_count=Post.comment_count + 1))
         await session.commit()
 
+    # Cached feed pages carry comment counts
+    await invalidate_feeds()
+
     return {"message": "Comment created successfully"}
 
 
@@ -50,10 +56,16 @@ async def respond_to_comment(comment_id: int, response: CommentResponseCreate, t
         # Create the comment response
         new_response = CommentResponse(text=response.text, user_id=user_obj.id, comment_id=comment_id)
 
-        # Add the response to the session and commit the changes
+        # Add the response and bump the post's comment counter in the same transaction
         session.add(new_response)
+        await session.execute(
+            update(Post).where(Post.id == comment.post_id).values(comment_count=Post.comment_count + 1)
+        )
         await session.commit()
 
+        # Cached feed pages carry comment counts
+        await invalidate_feeds()
+
         return {"message": "Comment response created successfully"}
 
 
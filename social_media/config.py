@@ -21,3 +21,26 @@ SMTP_USER = os.environ.get("SMTP_USER")
 SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
 SMTP_HOST = os.environ.get("SMTP_HOST")
 SMTP_PORT = os.environ.get("SMTP_PORT")
+
+# Directory of versioned model artefacts shared by the Celery workers and the API processes
+RECOMMENDATION_MODEL_PATH = os.environ.get("RECOMMENDATION_MODEL_PATH", "models/recommendations")
+# Processes computing recommendations for posts the background tasks have not processed yet
+RECOMMENDATION_WORKERS = int(os.environ.get("RECOMMENDATION_WORKERS", 2))
+# Computations in flight per API worker, further requests fall back to random posts
+RECOMMENDATION_QUEUE_DEPTH = int(os.environ.get("RECOMMENDATION_QUEUE_DEPTH", 8))
+RECOMMENDATION_TIMEOUT = float(os.environ.get("RECOMMENDATION_TIMEOUT", 0.5))
+# Corpora from this size on get approximate (LSH) neighbours, more tables and fewer bits raise recall.
+# 32 tables of 6 bits recover ~0.88 of the exact top 3 in benchmarks.lsh_recall (16 x 8 only ~0.35),
+# at about twice the build time of 16 x 8.
+RECOMMENDATION_LSH_MIN_POSTS = int(os.environ.get("RECOMMENDATION_LSH_MIN_POSTS", 50000))
+RECOMMENDATION_LSH_TABLES = int(os.environ.get("RECOMMENDATION_LSH_TABLES", 32))
+RECOMMENDATION_LSH_BITS = int(os.environ.get("RECOMMENDATION_LSH_BITS", 6))
+
+# What create_post does with near-duplicates of existing posts: "flag" stores them marked, "reject" answers 409
+DUPLICATE_POSTS = os.environ.get("DUPLICATE_POSTS", "flag")
+
+OPENSEARCH_HOST = os.environ.get("OPENSEARCH_HOST", "localhost")
+OPENSEARCH_PORT = int(os.environ.get("OPENSEARCH_PORT", 9200))
+# Connections kept open to OpenSearch per process, requests beyond it wait for a free one
+OPENSEARCH_POOL_SIZE = int(os.environ.get("OPENSEARCH_POOL_SIZE", 20))
+OPENSEARCH_TIMEOUT = float(os.environ.get("OPENSEARCH_TIMEOUT", 10))
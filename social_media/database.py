@@ -1,4 +1,5 @@
 '''Sqlalchemy packages to connect database'''
+from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -7,3 +8,8 @@ from .config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 engine = create_async_engine(DATABASE_URL, echo=True, future=True)
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+# Synchronous engine for Celery workers and maintenance commands, which run outside the event loop
+SYNC_DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+sync_engine = create_engine(SYNC_DATABASE_URL, future=True)
+sync_session_maker = sessionmaker(sync_engine, expire_on_commit=False)
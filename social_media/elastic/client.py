@@ -1,10 +1,38 @@
-from opensearchpy import OpenSearch, RequestsHttpConnection
+'''OpenSearch clients shared by the API, the Celery tasks and the commands'''
+from opensearchpy import AsyncOpenSearch, OpenSearch
+
+from social_media.config import OPENSEARCH_HOST, OPENSEARCH_POOL_SIZE, OPENSEARCH_PORT, OPENSEARCH_TIMEOUT
+
+HOSTS = [{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}]
 
 
 class ElasticCacheClient:
+    '''One AsyncOpenSearch client per process, opened and closed by the FastAPI lifespan'''
+
+    client = None
+
+    @classmethod
+    def connect(cls):
+        '''Create the process-wide client'''
+        # Connections are opened lazily and reused from an aiohttp pool of OPENSEARCH_POOL_SIZE
+        cls.client = AsyncOpenSearch(hosts=HOSTS, maxsize=OPENSEARCH_POOL_SIZE, timeout=OPENSEARCH_TIMEOUT)
+        return cls.client
+
+    @classmethod
+    async def close(cls):
+        '''Close the pooled connections of the process-wide client'''
+        if cls.client is not None:
+            await cls.client.close()
+            cls.client = None
+
+    @classmethod
+    def get_client(cls):
+        '''The process-wide client, created on first use outside the lifespan'''
+        if cls.client is None:
+            return cls.connect()
+        return cls.client
+
 
-    @staticmethod
-    def get_client():
-        client = OpenSearch(hosts=[{'host': 'localhost', 'port': 9200}], connection_class=RequestsHttpConnection)
-        print(client.info())
-        return client
+def sync_client(timeout=OPENSEARCH_TIMEOUT):
+    '''Blocking client for Celery tasks and maintenance commands'''
+    return OpenSearch(hosts=HOSTS, timeout=timeout)
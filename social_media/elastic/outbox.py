@@ -0,0 +1,122 @@
+'''Transactional outbox for the posts search index
+
+Post endpoints do not write to the search index themselves. They add a search_outbox
+row for the post in the same transaction as the change, so the index never misses a
+committed change and write latency does not depend on the search cluster. The
+drain_search_outbox Celery task sends the pending posts in bulk requests. The document
+is read from the post at that point, or deleted from the index when the post is gone.
+Drains run one at a time under SEARCH_OUTBOX_LOCK, since a drain holding an older
+snapshot of a post could otherwise send it after a concurrent drain sent a newer one.
+Failed rows are retried with exponential backoff.
+
+While commands/reindex_posts.py builds a new index, the drained post ids are also
+recorded in a Redis set, so the command can replay changes the new index missed.
+'''
+import logging
+
+from opensearchpy.helpers import bulk
+from redis.exceptions import RedisError
+from sqlalchemy import delete, func, select, update
+from social_media.auth.models import Post, SearchOutbox
+from social_media.cache import sync_redis_client
+
+from .search import POSTS_INDEX, post_document
+
+logger = logging.getLogger(__name__)
+
+SEARCH_OUTBOX_INTERVAL = 5
+SEARCH_OUTBOX_LOCK = "search:outbox_lock"
+# Outbox rows claimed and sent per bulk request
+SEARCH_OUTBOX_BATCH_SIZE = 500
+SEARCH_OUTBOX_MAX_ATTEMPTS = 10
+# Retry delay doubles per attempt up to this many seconds
+SEARCH_OUTBOX_MAX_BACKOFF = 600
+# Set by the reindex command while it builds, expires if the command dies
+REINDEX_KEY = "search:reindex"
+REINDEX_CHANGES_KEY = "search:reindex:changes"
+
+
+def enqueue_post(session, post_id):
+    '''Record a post change, committed together with the caller's transaction'''
+    session.add(SearchOutbox(post_id=post_id))
+
+
+def failed_post_ids(errors):
+    '''Post ids of the failed items of a bulk response'''
+    failed = set()
+    for error in errors:
+        for operation, item in error.items():
+            # Deleting a document the index never had is not a failure
+            if operation == "delete" and item.get("status") == 404:
+                continue
+            failed.add(int(item["_id"]))
+    return failed
+
+
+def index_actions(session, post_ids, index=POSTS_INDEX):
+    '''Bulk actions bringing the index up to date with the current state of the posts'''
+    posts = session.execute(select(Post.id, Post.title, Post.description).where(Post.id.in_(post_ids)))
+    posts = {post.id: post for post in posts}
+
+    return [{
+        "_op_type": "index",
+        "_index": index,
+        "_id": post_id,
+        "_source": post_document(posts[post_id]),
+    } if post_id in posts else {
+        "_op_type": "delete",
+        "_index": index,
+        "_id": post_id,
+    } for post_id in post_ids]
+
+
+def drain_outbox(session, client, batch_size=SEARCH_OUTBOX_BATCH_SIZE):
+    '''Send one batch of pending posts to the index, returns the number of outbox rows claimed'''
+    # Rows claimed by a concurrent drain are skipped instead of waited on
+    query = select(SearchOutbox.id, SearchOutbox.post_id).where(SearchOutbox.available_at <= func.now())
+    rows = session.execute(query.order_by(SearchOutbox.id).limit(batch_size).with_for_update(skip_locked=True)).all()
+    if not rows:
+        return 0
+
+    # Several changes of one post collapse into a single action
+    post_ids = sorted({row.post_id for row in rows})
+    actions = index_actions(session, post_ids)
+
+    # Recorded before sending, so a reindex replays anything that reached only the old index
+    try:
+        if sync_redis_client.exists(REINDEX_KEY):
+            sync_redis_client.sadd(REINDEX_CHANGES_KEY, *post_ids)
+    except RedisError as exc:
+        logger.warning("Could not record changes for a running reindex: %s", exc)
+
+    try:
+        _, errors = bulk(client, actions, raise_on_error=False, raise_on_exception=False)
+        failed = failed_post_ids(errors)
+    except Exception as exc:
+        logger.warning("Search outbox bulk request failed: %s", exc)
+        failed = set(post_ids)
+
+    sent_ids = [row.id for row in rows if row.post_id not in failed]
+    failed_ids = [row.id for row in rows if row.post_id in failed]
+
+    if sent_ids:
+        session.execute(delete(SearchOutbox).where(SearchOutbox.id.in_(sent_ids)))
+
+    if failed_ids:
+        logger.warning("%d posts failed to reach the search index, retrying later", len(failed))
+        backoff = func.least(func.power(2, SearchOutbox.attempts), SEARCH_OUTBOX_MAX_BACKOFF)
+        session.execute(
+            update(SearchOutbox).where(SearchOutbox.id.in_(failed_ids)).values(
+                attempts=SearchOutbox.attempts + 1,
+                available_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, backoff),
+            )
+        )
+        # Given up rows are left to the next `make reindex-posts`
+        given_up = delete(SearchOutbox).where(
+            SearchOutbox.id.in_(failed_ids), SearchOutbox.attempts >= SEARCH_OUTBOX_MAX_ATTEMPTS
+        )
+        dropped = session.execute(given_up.returning(SearchOutbox.post_id)).scalars().all()
+        if dropped:
+            logger.error("Gave up indexing posts %s after %d attempts", dropped, SEARCH_OUTBOX_MAX_ATTEMPTS)
+
+    return len(rows)
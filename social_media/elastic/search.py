@@ -1,25 +1,32 @@
-from typing import Any
+import logging
+
 from .client import ElasticCacheClient
 
+logger = logging.getLogger(__name__)
+
+# Alias of the current versioned posts index, see commands/reindex_posts.py
+POSTS_INDEX = "posts"
 
-class Search:
 
-    def __init__(self):
-        self.client = ElasticCacheClient.get_client()
+def post_document(post):
+    '''Indexed fields of a post'''
+    return {"id": post.id, "title": post.title, "description": post.description}
 
-    def create_document(self, index_name, document, id) -> Any:
-        return self.client.index(index=index_name, body=document, id=id, refresh=True)
 
-    def delete_document(self, index_name, id) -> Any:
-        return self.client.delete(index=index_name, id=id)
+class Search:
 
-    def update_document(self, index_name, document, id) -> Any:
-        return self.client.update(index=index_name, id=id, body={"doc": document})
+    def __init__(self, client=None):
+        self.client = client or ElasticCacheClient.get_client()
 
-    def get_data(self, index_name, search_query, size=10):
+    async def get_data(self, index_name, search_query, size=10, **params):
         try:
-            result = self.client.search(index=index_name, body=search_query, size=size)
+            result = await self.client.search(index=index_name, body=search_query, size=size, **params)
             return result
-        except Exception as e:
-            print("Error:", e)
-            raise e
+        except Exception as exc:
+            logger.error("Search on %s failed: %s", index_name, exc)
+            raise
+
+
+def get_search() -> Search:
+    '''Dependency sharing the application-wide client, no connection setup per request'''
+    return Search(ElasticCacheClient.get_client())
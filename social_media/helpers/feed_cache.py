@@ -0,0 +1,72 @@
+'''Caching first pages of the post feeds in Redis'''
+import logging
+from typing import Optional
+
+from redis.exceptions import RedisError
+from social_media.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# One hash per feed ordering, keyed by page size, so invalidation is a single DEL
+FEED_CACHE_KEY = "feed:{ordering}"
+CACHED_ORDERINGS = ("created_at", "likes", "views")
+# Views are bumped on every read and are not invalidated, the TTL bounds how stale they get
+FEED_CACHE_TTL = 60
+
+LOOKUPS_KEY = "feed:stats:lookups"
+MISSES_KEY = "feed:stats:misses"
+
+
+async def get_cached_feed(ordering: str, limit: int) -> Optional[bytes]:
+    '''Return the serialized first page of a feed, or None on a miss'''
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hget(FEED_CACHE_KEY.format(ordering=ordering), limit)
+            pipe.incr(LOOKUPS_KEY)
+            cached, _ = await pipe.execute()
+
+        if cached is None:
+            await redis_client.incr(MISSES_KEY)
+        return cached
+    except RedisError as exc:
+        logger.warning("Feed cache lookup failed: %s", exc)
+        return None
+
+
+async def set_cached_feed(ordering: str, limit: int, payload: bytes):
+    '''Store the serialized first page of a feed'''
+    key = FEED_CACHE_KEY.format(ordering=ordering)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, limit, payload)
+            pipe.expire(key, FEED_CACHE_TTL)
+            await pipe.execute()
+    except RedisError as exc:
+        logger.warning("Feed cache store failed: %s", exc)
+
+
+async def invalidate_feeds():
+    '''Drop the cached pages of every feed ordering after a write'''
+    try:
+        await redis_client.delete(*(FEED_CACHE_KEY.format(ordering=ordering) for ordering in CACHED_ORDERINGS))
+    except RedisError as exc:
+        logger.warning("Feed cache invalidation failed: %s", exc)
+
+
+async def get_feed_cache_stats() -> dict:
+    '''Hit and miss counters shared by all workers'''
+    try:
+        lookups, misses = await redis_client.mget(LOOKUPS_KEY, MISSES_KEY)
+    except RedisError as exc:
+        logger.warning("Feed cache stats lookup failed: %s", exc)
+        return {"hits": None, "misses": None, "hit_ratio": None}
+
+    lookups = int(lookups or 0)
+    misses = int(misses or 0)
+    hits = lookups - misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,96 @@
+'''Ranked search over posts and their authors
+
+Post text is matched against the generated search_vector column through its GIN
+index, author names with substring ILIKE served by the pg_trgm indexes on users.
+Both sides are combined in one statement and ordered by relevance: the full-text
+rank of the post plus the trigram similarity of the matching author. Only the ids
+and ranks of the matches are sorted, the posts and authors are joined for the page
+alone. Pages are keyset-paginated on (rank, id).
+
+The same pages are served from the posts search index by search_index_page, which
+pages with search_after and only reads post ids from the index.
+'''
+from sqlalchemy import desc, func, literal_column, or_, select, tuple_, union_all
+from sqlalchemy.orm import contains_eager
+from social_media.auth.models import Post, User
+from social_media.elastic.search import POSTS_INDEX
+from social_media.helpers.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from social_media.utils.format_post import format_posts_data
+
+# Has to match the configuration of POST_SEARCH_VECTOR for the GIN index to be used
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+# id breaks score ties, so search_after never skips or repeats a hit. unmapped_type keeps
+# indexes created before documents carried an id searchable until the next reindex.
+INDEX_SORT = [{"_score": "desc"}, {"id": {"order": "desc", "unmapped_type": "long"}}]
+
+
+def search_posts_query(q, after=None, limit=DEFAULT_PAGE_SIZE):
+    '''Posts matching q with their authors and rank, most relevant first'''
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    pattern = f"%{q}%"
+
+    # Each branch is served by its own indexes, a single OR across the join would scan both tables
+    text_rank = func.ts_rank(Post.search_vector, tsquery)
+    text_matches = select(Post.id, text_rank.label("rank")).where(Post.search_vector.op("@@")(tsquery))
+    author_rank = func.greatest(
+        func.similarity(User.name, q), func.similarity(User.surname, q), func.similarity(User.username, q)
+    )
+    author_matches = select(Post.id, author_rank.label("rank")).join(User, User.id == Post.author_id).where(
+        or_(User.name.ilike(pattern), User.surname.ilike(pattern), User.username.ilike(pattern))
+    )
+    matches = union_all(text_matches, author_matches).subquery()
+
+    # A post matching on both sides adds up both ranks
+    ranked = select(matches.c.id, func.sum(matches.c.rank).label("rank")).group_by(matches.c.id).subquery()
+    page = select(ranked)
+    if after is not None:
+        page = page.where(tuple_(ranked.c.rank, ranked.c.id) < tuple_(*after))
+    page = page.order_by(desc(ranked.c.rank), desc(ranked.c.id)).limit(limit).subquery()
+
+    return select(Post, page.c.rank).join(page, page.c.id == Post.id).outerjoin(Post.author).options(
+        contains_eager(Post.author)
+    ).order_by(desc(page.c.rank), desc(Post.id))
+
+
+async def search_posts_page(session, q, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    '''One page of search results with the cursor of the next page'''
+    after = decode_cursor(cursor, float, int) if cursor else None
+
+    rows = (await session.execute(search_posts_query(q, after, limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = encode_cursor(rows[-1].rank, rows[-1].Post.id) if has_more else None
+    return {"posts": format_posts_data(row.Post for row in rows), "next_cursor": next_cursor}
+
+
+async def search_index_page(session, search_index, q, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    '''One page of search index hits, hydrated from the database in one query'''
+    query = {"multi_match": {"query": q, "fields": ["title", "description"]}}
+    search_query = {"query": query, "sort": INDEX_SORT, "_source": False, "track_total_hits": False}
+    if cursor:
+        search_query["search_after"] = list(decode_cursor(cursor, float, int))
+
+    # Only ids and sort values come back, the posts themselves are read from the database
+    results = await search_index.get_data(
+        index_name=POSTS_INDEX,
+        search_query=search_query,
+        size=limit + 1,
+        filter_path=["hits.hits._id", "hits.hits.sort"],
+    )
+    hits = results.get("hits", {}).get("hits", [])
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+
+    post_ids = [int(hit["_id"]) for hit in hits]
+    posts = await session.execute(
+        select(Post).outerjoin(Post.author).options(contains_eager(Post.author)).where(Post.id.in_(post_ids))
+    )
+    posts = {post.id: post for post in posts.scalars()}
+
+    # Index order is kept, posts deleted since they were indexed drop out
+    next_cursor = encode_cursor(*hits[-1]["sort"]) if has_more else None
+    return {
+        "posts": format_posts_data(posts[post_id] for post_id in post_ids if post_id in posts),
+        "next_cursor": next_cursor,
+    }
@@ -1,19 +1,66 @@
 '''Shortening posts response'''
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
-from social_media.auth.models import Post, User
-from social_media.utils.format_post import format_post_data
+from datetime import datetime
 
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import desc, select, tuple_
+from sqlalchemy.orm import contains_eager
+from social_media.auth.models import Post
+from social_media.database import async_session_maker
+from social_media.helpers.feed_cache import get_cached_feed, set_cached_feed
+from social_media.helpers.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from social_media.utils.format_post import format_posts_data
 
-async def get_formatted_posts(session, ordering):
-    '''Helper to shorten posts query'''
-    posts = await session.execute(select(Post).join(User).options(joinedload(Post.author)).order_by(ordering))
-    all_posts = posts.scalars().all()
+# Feed orderings: the sort column and how to read its value back from a cursor.
+# Every ordering is tie-broken by Post.id, matching the (column, id) indexes on posts.
+FEED_ORDERINGS = {
+    "created_at": (Post.created_at, datetime.fromisoformat),
+    "likes": (Post.likes, int),
+    "views": (Post.views, int),
+}
 
-    formatted_posts = []
-    for post in all_posts:
-        # Use the format_post_data function to format the post data
-        formatted_post = await format_post_data(post, session)
-        formatted_posts.append(formatted_post)
 
-    return formatted_posts
+def get_feed_query(ordering, cursor=None):
+    '''Feed query with authors, starting after the cursor when one is given'''
+    column, parse_value = FEED_ORDERINGS[ordering]
+
+    query = select(Post).join(Post.author).options(contains_eager(Post.author)).order_by(desc(column), desc(Post.id))
+    if cursor:
+        value, post_id = decode_cursor(cursor, parse_value, int)
+        query = query.where(tuple_(column, Post.id) < tuple_(value, post_id))
+
+    return query
+
+
+async def get_formatted_posts(session, ordering, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    '''Helper to shorten posts query, returns one page of the feed and the cursor for the next one'''
+    column, _ = FEED_ORDERINGS[ordering]
+
+    posts = await session.execute(get_feed_query(ordering, cursor).limit(limit + 1))
+    page_posts = posts.scalars().all()
+
+    next_cursor = None
+    if len(page_posts) > limit:
+        page_posts = page_posts[:limit]
+        last_post = page_posts[-1]
+        next_cursor = encode_cursor(getattr(last_post, column.key), last_post.id)
+
+    return {"posts": format_posts_data(page_posts), "next_cursor": next_cursor}
+
+
+async def get_feed_page(ordering, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    '''Serve a feed page, answering first pages from the Redis cache when possible'''
+    if cursor is None:
+        cached = await get_cached_feed(ordering, limit)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
+
+    async with async_session_maker() as session:
+        page = await get_formatted_posts(session, ordering, cursor, limit)
+
+    if cursor is None:
+        payload = orjson.dumps(page)
+        await set_cached_feed(ordering, limit, payload)
+        return Response(content=payload, media_type="application/json")
+
+    return ORJSONResponse(page)
@@ -2,41 +2,45 @@
 from typing import List
 import random
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, select
 from social_media.auth.models import Post, User
+from social_media.utils.format_post import serialize_author, serialize_post
 
+# Random ids probed per round, ids freed by deleted posts simply miss
+RANDOM_PROBES = 12
+RANDOM_PROBE_ROUNDS = 3
 
-async def get_random_recommendations(session: AsyncSession, post_id: int) -> List[Post]:
-    '''Handling generating recommendation posts'''
-    result = (
-        await session.execute(
-            select(Post, User).join(User,
-                                    User.id == Post.author_id).where(Post.id != post_id)  # Exclude the current post
-        )
-    )
 
-    recommended_posts = []
-    for post, author in result:
-        post_data = {
-            "id": post.id,
-            "title": post.title,
-            "description": post.description,
-            "likes": post.likes,
-            "dislikes": post.dislikes,
-            "views": post.views,
-            "created_at": post.created_at.strftime("%Y-%m-%d") if post.created_at else None,
-            "updated_at": post.updated_at.strftime("%Y-%m-%d") if post.updated_at else None,
-            "author": {
-                "id": author.id,
-                "username": author.username,
-                "name": author.name,
-                "surname": author.surname,
-            }
-        }
-        recommended_posts.append(post_data)
+async def get_random_recommendations(session: AsyncSession, post_id: int, count: int = 3) -> List[Post]:
+    '''Handling generating recommendation posts
 
-    # Choose three random posts from the recommendations
-    num_recommendations = min(3, len(recommended_posts))
-    random_recommendations = random.sample(recommended_posts, num_recommendations)
+    Samples random ids between the smallest and largest post id instead of loading every
+    post, so each call costs a few primary key lookups regardless of the table size.
+    '''
+    min_id, max_id = (await session.execute(select(func.min(Post.id), func.max(Post.id)))).one()
+    if min_id is None:
+        return []
+
+    found = {}
+    for _ in range(RANDOM_PROBE_ROUNDS):
+        probes = {random.randint(min_id, max_id) for _ in range(RANDOM_PROBES)} - set(found) - {post_id}
+        result = await session.execute(
+            select(Post, User).join(User, User.id == Post.author_id).where(Post.id.in_(probes))
+        )
+        for post, author in result:
+            found[post.id] = {**serialize_post(post), "author": serialize_author(author)}
+        if len(found) >= count:
+            break
+    else:
+        # Very sparse ids, take the posts following a random id instead
+        result = await session.execute(
+            select(Post, User).join(User, User.id == Post.author_id).where(
+                Post.id >= random.randint(min_id, max_id), Post.id != post_id, Post.id.not_in(found)
+            ).order_by(Post.id).limit(count - len(found))
+        )
+        for post, author in result:
+            found[post.id] = {**serialize_post(post), "author": serialize_author(author)}
 
-    return random_recommendations
+    # Choose three random posts from the recommendations
+    recommended_posts = list(found.values())
+    return random.sample(recommended_posts, min(count, len(recommended_posts)))
@@ -0,0 +1,41 @@
+'''Recording likes and dislikes in a single statement'''
+from sqlalchemy import case, literal, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+from social_media.auth.models import Post, Reaction
+
+REACTIONS = ("like", "dislike")
+
+
+def reaction_statement(post_id: int, user_id: int, reaction: str):
+    '''Upsert the user's reaction and shift the post counters by the change, returning the new counters
+
+    The reaction row is only written when the post exists, is not the user's own and the
+    reaction actually changes; in every other case the statement returns no row.
+    '''
+    upsert = insert(Reaction).from_select(
+        ["post_id", "user_id", "reaction"],
+        select(Post.id, literal(user_id), literal(reaction)).where(Post.id == post_id, Post.author_id != user_id),
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[Reaction.post_id, Reaction.user_id],
+        set_=dict(reaction=upsert.excluded.reaction),
+        where=Reaction.reaction != upsert.excluded.reaction,
+    )
+    upsert = upsert.returning(Reaction.post_id, literal_column("xmax = 0").label("inserted")).cte("upsert")
+
+    # A new reaction adds one, switching also takes one away from the other counter
+    switched = case((upsert.c.inserted, 0), else_=-1)
+    likes_delta, dislikes_delta = (1, switched) if reaction == "like" else (switched, 1)
+
+    counters = update(Post).where(Post.id == upsert.c.post_id)
+    counters = counters.values(likes=Post.likes + likes_delta, dislikes=Post.dislikes + dislikes_delta)
+    return counters.returning(Post.likes, Post.dislikes)
+
+
+async def apply_reaction(session, post_id: int, user_id: int, reaction: str):
+    '''Run the reaction statement, returns (likes, dislikes) or None when nothing changed'''
+    # The counters come back through RETURNING, no loaded objects need synchronizing
+    counters = await session.execute(
+        reaction_statement(post_id, user_id, reaction).execution_options(synchronize_session=False)
+    )
+    return counters.first()
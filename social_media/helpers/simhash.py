@@ -0,0 +1,81 @@
+'''SimHash fingerprints for near-duplicate post detection
+
+A post's fingerprint is the 64-bit SimHash of the words of its title and description,
+stored signed in the BigInteger posts.simhash column. Texts that differ in a few words
+get fingerprints that differ in a few bits.
+
+Lookups split fingerprints into four 16-bit bands, each with its own covering expression index.
+Two fingerprints within SIMHASH_MAX_DISTANCE (< 4) bits agree on at least one whole
+band, so matching any band finds every candidate, then the exact distance is checked.
+'''
+import re
+from collections import Counter
+from hashlib import blake2b
+
+from sqlalchemy import BigInteger, bindparam, literal_column, select, union_all
+from social_media.auth.models import Post
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+SIMHASH_MAX_DISTANCE = 3
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _to_signed(value):
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def simhash(*texts):
+    '''Signed 64-bit SimHash of the words of some texts'''
+    weights = [0] * SIMHASH_BITS
+    tokens = Counter(token for text in texts if text for token in _TOKEN.findall(text.lower()))
+
+    for token, count in tokens.items():
+        hashed = int.from_bytes(blake2b(token.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if hashed >> bit & 1 else -count
+
+    fingerprint = sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+    return _to_signed(fingerprint)
+
+
+def hamming_distance(first, second):
+    '''Number of bits two fingerprints differ in'''
+    return ((first ^ second) & ((1 << SIMHASH_BITS) - 1)).bit_count()
+
+
+def band(value, number):
+    '''Band of a fingerprint, either a Python int or the posts.simhash column
+
+    The column expression must match the expression indexes exactly, so the constants
+    are rendered inline rather than as bound parameters.
+    '''
+    shift = BAND_BITS * (SIMHASH_BANDS - 1 - number)
+    mask = (1 << BAND_BITS) - 1
+    if isinstance(value, int):
+        return value >> shift & mask
+    return value.op(">>")(literal_column(str(shift))).op("&")(literal_column(str(mask)))
+
+
+def _band_candidates(number):
+    '''Posts sharing one band with the fingerprint bound to band_<number>'''
+    fingerprint_band = bindparam(f"band_{number}", type_=BigInteger)
+    return select(Post.id, Post.simhash).where(band(Post.simhash, number) == fingerprint_band)
+
+
+# One index-only scan per band, a UNION ALL keeps them apart where an OR would turn into a bitmap heap scan.
+# Built once, only the band values change between lookups.
+NEAR_DUPLICATES_QUERY = union_all(*(_band_candidates(number) for number in range(SIMHASH_BANDS)))
+
+
+async def find_near_duplicates(session, fingerprint, exclude_id=None, max_distance=SIMHASH_MAX_DISTANCE):
+    '''Ids of posts whose fingerprint is within max_distance bits, closest first'''
+    bands = {f"band_{number}": band(fingerprint, number) for number in range(SIMHASH_BANDS)}
+    candidates = await session.execute(NEAR_DUPLICATES_QUERY, bands)
+
+    distances = {
+        post_id: hamming_distance(fingerprint, other) for post_id, other in candidates if post_id != exclude_id
+    }
+    return sorted((post_id for post_id, distance in distances.items() if distance <= max_distance), key=distances.get)
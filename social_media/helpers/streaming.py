@@ -0,0 +1,27 @@
+'''Streaming large listings as NDJSON'''
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from social_media.database import async_session_maker
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows fetched from the server-side cursor and sent per chunk
+STREAM_CHUNK_SIZE = 500
+
+
+def wants_ndjson(request: Request) -> bool:
+    '''Check whether the client opted in to NDJSON with the Accept header'''
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def stream_ndjson(statement, formatter, chunk_size: int = STREAM_CHUNK_SIZE) -> StreamingResponse:
+    '''Stream the rows of a select through a server-side cursor, one JSON document per line'''
+
+    async def generate_lines():
+        # The session lives as long as the response body, so it is opened inside the generator
+        async with async_session_maker() as session:
+            result = await session.stream(statement.execution_options(yield_per=chunk_size))
+            async for rows in result.scalars().partitions():
+                yield b"".join(orjson.dumps(formatter(row)) + b"\n" for row in rows)
+
+    return StreamingResponse(generate_lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,172 @@
+'''Home timelines of subscribed posts
+
+Every user has a capped Redis sorted set of post ids from the accounts they follow,
+scored by creation time in microseconds. Members are zero-padded ids, so posts created
+at the same time rank by id like they do in Postgres. New posts are pushed to followers
+by the fan_out_post Celery task. Accounts with more than FANOUT_MAX_FOLLOWERS followers
+are not fanned out, their posts are merged into the page at read time instead.
+
+When the timeline cannot serve a page, the page comes from a single keyset-paginated
+join through subscriptions instead. Both paths order and page by (created_at, id), so a
+cursor stays valid when a page switches between them.
+'''
+import logging
+from datetime import datetime, time, timedelta
+
+from redis.exceptions import RedisError
+from sqlalchemy import desc, select, tuple_
+from sqlalchemy.orm import contains_eager
+from social_media.auth.models import Post, Subscription
+from social_media.cache import redis_client
+from social_media.helpers.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from social_media.utils.format_post import format_posts_data
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_KEY = "timeline:{user_id}"
+TIMELINE_SIZE = 800
+# Authors above this many followers are read on demand instead of fanned out
+FANOUT_MAX_FOLLOWERS = 10000
+CELEBRITIES_KEY = "timeline:celebrities"
+EPOCH = datetime(1970, 1, 1)
+
+# Only timelines that already exist are extended, missing ones are rebuilt in full on read
+PUSH_TO_TIMELINE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+end
+"""
+
+# Returns the size of the timeline and up to ARGV[3] entries with scores, newest first,
+# after the cursor score ARGV[1] and member ARGV[2], or from the top without a cursor.
+# The range starts at the cursor score itself, over-fetching by the entries tied with it,
+# and those up to the cursor member are skipped.
+READ_TIMELINE_SCRIPT = """
+local size = redis.call('ZCARD', KEYS[1])
+if ARGV[2] == '' then
+    return {size, redis.call('ZREVRANGEBYSCORE', KEYS[1], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, ARGV[3])}
+end
+
+local ties = redis.call('ZCOUNT', KEYS[1], ARGV[1], ARGV[1])
+local entries = redis.call(
+    'ZREVRANGEBYSCORE', KEYS[1], ARGV[1], '-inf', 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[3]) + ties
+)
+local page = {}
+for i = 1, #entries, 2 do
+    if #page < 2 * tonumber(ARGV[3]) and (tonumber(entries[i + 1]) ~= tonumber(ARGV[1]) or entries[i] < ARGV[2]) then
+        table.insert(page, entries[i])
+        table.insert(page, entries[i + 1])
+    end
+end
+return {size, page}
+"""
+
+read_timeline = redis_client.register_script(READ_TIMELINE_SCRIPT)
+
+
+def timeline_score(created_at) -> int:
+    '''Creation time of a post in microseconds, exact in the double of a sorted set score'''
+    if not isinstance(created_at, datetime):
+        created_at = datetime.combine(created_at, time())
+    return (created_at - EPOCH) // timedelta(microseconds=1)
+
+
+def timeline_member(post_id: int) -> str:
+    '''Sorted set member of a post, padded so members sort like ids'''
+    return f"{post_id:010d}"
+
+
+async def reset_timeline(user_id: int):
+    '''Drop a timeline so it is rebuilt on next read, e.g. after (un)subscribing'''
+    try:
+        await redis_client.delete(TIMELINE_KEY.format(user_id=user_id))
+    except RedisError as exc:
+        logger.warning("Timeline reset failed: %s", exc)
+
+
+def subscribed_posts_query(query, user_id, after=None, author_ids=None):
+    '''Restrict a posts select to the followed accounts, newest first, starting after a (created_at, id) key'''
+    query = query.join(Subscription, Subscription.subscribed_to_id == Post.author_id).where(
+        Subscription.subscriber_id == user_id
+    ).order_by(desc(Post.created_at), desc(Post.id))
+    if after is not None:
+        query = query.where(tuple_(Post.created_at, Post.id) < tuple_(*after))
+    if author_ids is not None:
+        query = query.where(Post.author_id.in_(author_ids))
+
+    return query
+
+
+async def get_subscribed_posts_page(session, user_id, after=None, limit=DEFAULT_PAGE_SIZE):
+    '''Posts of the followed accounts with their authors, in one statement'''
+    query = select(Post).join(Post.author).options(contains_eager(Post.author))
+    posts = await session.execute(subscribed_posts_query(query, user_id, after).limit(limit))
+    return posts.scalars().all()
+
+
+async def get_subscribed_post_keys(session, user_id, after=None, limit=TIMELINE_SIZE, author_ids=None):
+    '''Newest (score, id) keys of the followed accounts' posts, optionally restricted to some of them'''
+    query = subscribed_posts_query(select(Post.created_at, Post.id), user_id, after, author_ids)
+    rows = await session.execute(query.limit(limit))
+    return [(timeline_score(created_at), post_id) for created_at, post_id in rows]
+
+
+async def _read_timeline(session, user_id, after, limit):
+    '''Page of post ids from Redis, or None when the database has to serve the page'''
+    key = TIMELINE_KEY.format(user_id=user_id)
+    after_key = (timeline_score(after[0]), after[1]) if after is not None else None
+    args = [after_key[0], timeline_member(after_key[1]), limit] if after_key else ["+inf", "", limit]
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        await read_timeline(keys=[key], args=args, client=pipe)
+        pipe.smembers(CELEBRITIES_KEY)
+        (size, entries), celebrity_ids = await pipe.execute()
+
+    keys = [(int(float(score)), int(member)) for member, score in zip(entries[::2], entries[1::2])]
+    celebrity_ids = [int(author_id) for author_id in celebrity_ids]
+
+    if not size:
+        # Cold timeline, rebuild it from the database
+        rebuilt_keys = await get_subscribed_post_keys(session, user_id)
+        if not rebuilt_keys:
+            return None
+        await redis_client.zadd(key, {timeline_member(post_id): score for score, post_id in rebuilt_keys})
+        keys = [post_key for post_key in rebuilt_keys if after_key is None or post_key < after_key][:limit]
+    elif len(keys) < limit and size >= TIMELINE_SIZE:
+        # Paged past the capped timeline
+        return None
+
+    if celebrity_ids:
+        # Fan-out-on-read for large accounts that were not pushed to timelines
+        keys += await get_subscribed_post_keys(session, user_id, after, limit, celebrity_ids)
+
+    return [post_id for _, post_id in sorted(set(keys), reverse=True)[:limit]]
+
+
+async def get_timeline_page(session, user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    '''One page of the subscribed posts, newest first, with the cursor of the next page'''
+    after = decode_cursor(cursor, datetime.fromisoformat, int) if cursor else None
+
+    try:
+        post_ids = await _read_timeline(session, user_id, after, limit + 1)
+    except RedisError as exc:
+        logger.warning("Timeline read failed, reading from the database: %s", exc)
+        post_ids = None
+
+    if post_ids is None:
+        posts = await get_subscribed_posts_page(session, user_id, after, limit + 1)
+        has_more = len(posts) > limit
+    else:
+        has_more = len(post_ids) > limit
+        # Hydrate the page in one query, deleted posts simply drop out
+        query = select(Post).join(Post.author).options(contains_eager(Post.author))
+        posts = await session.execute(
+            query.where(Post.id.in_(post_ids[:limit])).order_by(desc(Post.created_at), desc(Post.id))
+        )
+        posts = posts.scalars().all()
+
+    posts = posts[:limit]
+    next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id) if has_more and posts else None
+
+    return {"posts": format_posts_data(posts), "next_cursor": next_cursor}
@@ -1,15 +1,29 @@
 '''Initializing FastAPI'''
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from .ai.pool import shutdown_executor
+from .elastic.client import ElasticCacheClient
 from .auth.router import router as auth_router
 from .post.router import router as post_router
 from .comment.router import router as comment_router
 from .subscription.router import router as subscription_router
 from .tasks.router import router as celery_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    '''Process-wide resources shared by all requests'''
+    ElasticCacheClient.connect()
+    yield
+    await ElasticCacheClient.close()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -1,48 +1,70 @@
 '''Handling post endpoint'''
 import os
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from sqlalchemy import desc, func, or_, select
-from sqlalchemy.orm import aliased, joinedload
-
-from social_media.auth.models import Comment, CommentResponse, Post, Reaction, User
+from typing import Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import ORJSONResponse
+from opensearchpy.exceptions import OpenSearchException
+from sqlalchemy import desc, select
+from sqlalchemy.orm import contains_eager, joinedload
+
+from social_media.auth.models import Post, PostCoLike, Reaction, User
 from social_media.auth.jwt.jwt_bearer import JwtBearer
 from social_media.auth.jwt.jwt_handler import verify_token
+from social_media.config import DUPLICATE_POSTS
 from social_media.database import async_session_maker
-from social_media.elastic.search import Search
+from social_media.elastic.outbox import enqueue_post
+from social_media.elastic.search import Search, get_search
 from social_media.helpers.auth_user import get_authenticated_user
-from social_media.ai.recommendations import get_similar_posts, get_similarity_matrix
-from social_media.helpers.posts import get_formatted_posts
-from social_media.utils.format_post import format_post_data
+from social_media.ai.collaborative import CO_LIKES_PER_POST
+from social_media.ai.recommendations import get_similar_posts, mark_post_changed
+from social_media.helpers.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from social_media.helpers.feed_cache import get_feed_cache_stats, invalidate_feeds
+from social_media.helpers.post_search import search_index_page, search_posts_page
+from social_media.helpers.posts import get_feed_page, get_feed_query
+from social_media.helpers.reactions import REACTIONS, apply_reaction
+from social_media.helpers.simhash import find_near_duplicates, simhash
+from social_media.helpers.streaming import stream_ndjson, wants_ndjson
+from social_media.helpers.view_counter import record_view
+from social_media.tasks.tasks import fan_out_post
+from social_media.utils.format_post import format_post_data, serialize_author, serialize_post
 from .schemas import PostSchema
 
-router = APIRouter(prefix="/post", tags=["Post"])
-
-
-class IndexResource:
-
-    def __init__(self):
-        self.search = Search()
+router = APIRouter(prefix="/post", tags=["Post"], default_response_class=ORJSONResponse)
 
 
 @router.get("/posts")
-async def get_posts():
-    '''Getting all posts (GET)'''
-    async with async_session_maker() as session:
-        return await get_formatted_posts(session, desc(Post.created_at))
+async def get_posts(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    '''Getting all posts (GET), the whole feed is streamed with Accept: application/x-ndjson'''
+    if wants_ndjson(request):
+        return stream_ndjson(get_feed_query("created_at", cursor), format_post_data)
+
+    return await get_feed_page("created_at", cursor, limit)
 
 
 @router.get("/posts/order_likes")
-async def get_posts_ordered_by_likes():
+async def get_posts_ordered_by_likes(
+    cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
     '''Getting all posts ordered by likes (GET)'''
-    async with async_session_maker() as session:
-        return await get_formatted_posts(session, desc(Post.likes))
+    return await get_feed_page("likes", cursor, limit)
 
 
 @router.get("/posts/order_views")
-async def get_posts_ordered_by_views():
+async def get_posts_ordered_by_views(
+    cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
     '''Getting all posts ordered by views (GET)'''
-    async with async_session_maker() as session:
-        return await get_formatted_posts(session, desc(Post.views))
+    return await get_feed_page("views", cursor, limit)
+
+
+@router.get("/posts/cache_stats")
+async def get_posts_cache_stats():
+    '''Hit and miss counters of the feed cache (GET)'''
+    return await get_feed_cache_stats()
 
 
 @router.post("/create_post")
@@ -50,7 +72,6 @@ async def create_post(
     title: str,
     description: str,
     image: UploadFile = File(None),
-    index_resource: IndexResource = Depends(IndexResource),
     token: str = Depends(JwtBearer()),
 ):
     '''Creating Post (POST)'''
@@ -62,7 +83,22 @@ async def create_post(
         user = await session.execute(select(User).where(User.username == username))
         user_obj = user.scalar_one_or_none()
 
-    new_post = Post(title=title, description=description, likes=0, dislikes=0, author_id=user_obj.id)
+        # Look for near-duplicates through the banded SimHash indexes before storing anything
+        fingerprint = simhash(title, description)
+        duplicates = await find_near_duplicates(session, fingerprint)
+
+    if duplicates and DUPLICATE_POSTS == "reject":
+        raise HTTPException(status_code=409, detail=f"Post is a near-duplicate of post {duplicates[0]}")
+
+    new_post = Post(
+        title=title,
+        description=description,
+        likes=0,
+        dislikes=0,
+        author_id=user_obj.id,
+        simhash=fingerprint,
+        duplicate_of_id=duplicates[0] if duplicates else None,
+    )
 
     if image:
         image_data = await image.read()
@@ -77,13 +113,19 @@ async def create_post(
     # Add the post to the session and commit the changes
     async with async_session_maker() as session:
         session.add(new_post)
+        await session.flush()
+        enqueue_post(session, new_post.id)
         await session.commit()
 
-    post_document = {"title": new_post.title, "description": new_post.description}
+    await invalidate_feeds()
+    fan_out_post.delay(new_post.id, user_obj.id)
+    await mark_post_changed(new_post.id)
 
-    doc = index_resource.search.create_document(index_name='posts', document=post_document, id=new_post.id)
-
-    return {"message": "Post created successfully", "data": doc}
+    return {
+        "message": "Post created successfully",
+        "data": dict(id=new_post.id),
+        "duplicate_of": new_post.duplicate_of_id
+    }
 
 
 @router.get("/my_posts", dependencies=[Depends(JwtBearer())])
@@ -107,7 +149,6 @@ async def update_post(
     post_id: int,
     updated_post: PostSchema,
     token: str = Depends(JwtBearer()),
-    index_resource: IndexResource = Depends(IndexResource)
 ):
     '''Updating Post (PUT)'''
 
@@ -126,20 +167,19 @@ async def update_post(
         # Update the post with the provided data
         existing_post.title = updated_post.title
         existing_post.description = updated_post.description
+        existing_post.simhash = simhash(updated_post.title, updated_post.description)
+        enqueue_post(session, existing_post.id)
 
         await session.commit()
 
-        post_document = {"title": existing_post.title, "description": existing_post.description}
-
-        index_resource.search.update_document(index_name='posts', document=post_document, id=existing_post.id)
+    await invalidate_feeds()
+    await mark_post_changed(post_id)
 
     return {"message": "Post updated successfully"}
 
 
 @router.delete("/posts/{post_id}", dependencies=[Depends(JwtBearer())])
-async def delete_post(
-    post_id: int, token: str = Depends(JwtBearer()), index_resource: IndexResource = Depends(IndexResource)
-):
+async def delete_post(post_id: int, token: str = Depends(JwtBearer())):
     '''Deleting Post (DELETE)'''
 
     # Retrieve the authenticated user
@@ -156,11 +196,13 @@ async def delete_post(
         if post.author_id != user_obj.id:
             raise HTTPException(status_code=403, detail="Unauthorized to delete the post")
 
-        index_resource.search.delete_document(index_name='posts', id=post.id)
-
         await session.delete(post)
+        enqueue_post(session, post.id)
         await session.commit()
 
+    await invalidate_feeds()
+    await mark_post_changed(post_id)
+
     return {"message": "Post deleted successfully"}
 
 
@@ -168,48 +210,33 @@ async def delete_post(
 async def react_to_post(post_id: int, reaction: str, token: str = Depends(JwtBearer())):
     '''Reaction to post: like or dislike'''
 
+    if reaction not in REACTIONS:
+        raise HTTPException(status_code=400, detail="Reaction must be either 'like' or 'dislike'")
+
     # Retrieve the authenticated user
     user_obj = await get_authenticated_user(token)
 
     async with async_session_maker() as session:
 
-        # Retrieve the post from the database
-        post = await session.get(Post, post_id)
-        if not post:
-            raise HTTPException(status_code=404, detail="Post not found")
+        # Upsert the reaction and adjust the post counters in one round trip
+        counters = await apply_reaction(session, post_id, user_obj.id, reaction)
+
+        if not counters:
+            # Nothing was written, find out why
+            post = await session.get(Post, post_id)
+            if not post:
+                raise HTTPException(status_code=404, detail="Post not found")
 
-        # Check if the user has already reacted to the post
-        reaction_obj = await session.execute(
-            select(Reaction).where(Reaction.post_id == post.id, Reaction.user_id == user_obj.id)
-        )
-        existing_reaction = reaction_obj.scalar_one_or_none()
-
-        if existing_reaction:
-            # User has already reacted to the post, update the reaction
-            if existing_reaction.reaction == reaction:
-                raise HTTPException(status_code=400, detail="User has already reacted with the same reaction")
-
-            # Update the reaction and save changes
-            existing_reaction.reaction = reaction
-            await session.commit()
-        else:
-            # Check if the user is the author of the post
             if user_obj.id == post.author_id:
                 raise HTTPException(status_code=403, detail="User cannot react to their own post")
 
-            # User has not reacted to the post, create a new reaction
-            new_reaction = Reaction(post_id=post.id, user_id=user_obj.id, reaction=reaction)
-            session.add(new_reaction)
-            await session.commit()
+            raise HTTPException(status_code=400, detail="User has already reacted with the same reaction")
 
-            # Increment the likes or dislikes count based on the reaction
-            if reaction == "like":
-                post.likes += 1
-            elif reaction == "dislike":
-                post.dislikes += 1
-            await session.commit()
+        await session.commit()
+
+    await invalidate_feeds()
 
-    return {"message": "Reaction recorded successfully"}
+    return {"message": "Reaction recorded successfully", "likes": counters.likes, "dislikes": counters.dislikes}
 
 
 @router.get("/liked_posts", dependencies=[Depends(JwtBearer())])
@@ -229,64 +256,25 @@ async def get_liked_posts(token: str = Depends(JwtBearer())):
         user_liked_posts = liked_posts.scalars().all()
 
         # Extract the required data and include the author's username
-        formatted_posts = []
-        for post in user_liked_posts:
-            author_username = post.author.username if post.author else None
-
-            created_at = post.created_at.strftime("%Y-%m-%d") if post.created_at else None
-            updated_at = post.updated_at.strftime("%Y-%m-%d") if post.updated_at else None
+        formatted_posts = [{
+            **serialize_post(post),
+            "author_id": post.author_id,
+            "author_username": post.author.username if post.author else None,
+        } for post in user_liked_posts]
 
-            formatted_posts.append({
-                "id": post.id,
-                "title": post.title,
-                "description": post.description,
-                "likes": post.likes,
-                "dislikes": post.dislikes,
-                "views": post.views,
-                "author_id": post.author_id,
-                "author_username": author_username,
-                "created_at": created_at,
-                "updated_at": updated_at,
-            })
-
-        return formatted_posts
+        return ORJSONResponse(formatted_posts)
 
 
 @router.get("/search")
-async def search(q: str):
-    '''Search posts by title or username (GET)'''
+async def search(
+    q: str = Query(..., min_length=1),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    '''Search posts by text or author name (GET), most relevant first'''
 
     async with async_session_maker() as session:
-        user_alias = aliased(User)
-        unique_posts = set()
-
-        # Search for posts with the keyword in their title
-        posts_by_title = await session.execute(
-            select(Post).join(user_alias, user_alias.id == Post.author_id).where(Post.title.ilike(f"%{q}%")
-                                                                                 ).options(joinedload(Post.author))
-        )
-
-        # Search for posts with the keyword in the User's name, surname, or username
-        posts_by_user = await session.execute(
-            select(Post).outerjoin(user_alias, user_alias.id == Post.author_id).where(
-                or_(
-                    user_alias.name.ilike(f"%{q}%"), user_alias.surname.ilike(f"%{q}%"),
-                    user_alias.username.ilike(f"%{q}%")
-                )
-            ).options(joinedload(Post.author))
-        )
-
-        # Extract the required data for posts
-        formatted_posts = []
-        for post in posts_by_title.scalars().all() + posts_by_user.scalars().all():
-            if post.id not in unique_posts:
-                unique_posts.add(post.id)
-
-                # Use the format_post_data function to format the post data
-                formatted_post = await format_post_data(post, session)
-                formatted_posts.append(formatted_post)
-
-        return formatted_posts
+        return await search_posts_page(session, q, cursor, limit)
 
 
 @router.get("/posts/{post_id}/view")
@@ -304,55 +292,49 @@ async def view_post(post_id: int):
 
         post, author = post_with_author
 
-        # Increment the view count
-        post.views += 1
-        await session.commit()
-
-        # Count the number of comments for the post
-        num_comments = await session.execute(select(func.count(Comment.id)).where(Comment.post_id == post_id))
-        num_comments = num_comments.scalar()
+        # Count the view in the write-behind buffer instead of locking the post row
+        pending_views = await record_view(session, post.id)
 
-        # Count the number of comment responses for the post
-        num_comment_responses = await session.execute(
-            select(func.count(CommentResponse.id)
-                   ).join(Comment, Comment.id == CommentResponse.comment_id).where(Comment.post_id == post_id)
-        )
-        num_comment_responses = num_comment_responses.scalar()
-
-        # Calculate the total number of comments and comment responses
-        total_num_comments = num_comments + num_comment_responses
-
-        similarity_matrix = await get_similarity_matrix(session)
-        recommendations = await get_similar_posts(session, post_id, similarity_matrix)
+        recommendations = await get_similar_posts(session, post)
 
         # recommendations = await get_random_recommendations(session, post_id)
-        created_at = post.created_at.strftime("%Y-%m-%d") if post.created_at else None
-        updated_at = post.updated_at.strftime("%Y-%m-%d") if post.updated_at else None
-        return {
+        return ORJSONResponse({
             "post": {
-                "id": post.id,
-                "title": post.title,
-                "description": post.description,
-                "likes": post.likes,
-                "dislikes": post.dislikes,
-                "views": post.views,
-                "total_num_comments": total_num_comments,
-                "author": {
-                    "id": author.id,
-                    "username": author.username,
-                    "name": author.name,
-                    "surname": author.surname,
-                },
-                "created_at": created_at,
-                "updated_at": updated_at,
+                **serialize_post(post),
+                "views": post.views + pending_views,
+                "total_num_comments": post.comment_count,
+                "author": serialize_author(author),
             },
             "recommendations": recommendations
-        }
+        })
+
+
+@router.get("/posts/{post_id}/also_liked")
+async def get_also_liked_posts(post_id: int, limit: int = Query(3, ge=1, le=CO_LIKES_PER_POST)):
+    '''Posts liked by the users who liked this post (GET)'''
+
+    async with async_session_maker() as session:
+        # Precomputed by the refresh_co_likes task, hydrated with their authors in one query
+        co_liked = await session.execute(
+            select(Post, User, PostCoLike.score).join(User, User.id == Post.author_id).join(
+                PostCoLike, PostCoLike.co_liked_post_id == Post.id
+            ).where(PostCoLike.post_id == post_id).order_by(PostCoLike.rank).limit(limit)
+        )
+        also_liked = [{
+            **serialize_post(post),
+            "author": serialize_author(author),
+            "score": score,
+        } for post, author, score in co_liked]
+
+        if not also_liked and not await session.get(Post, post_id):
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        return ORJSONResponse(also_liked)
 
 
 @router.get("/users/{user_id}/posts")
-async def get_any_user_posts(user_id: int):
-    '''Getting all posts by a user (GET)'''
+async def get_any_user_posts(user_id: int, request: Request):
+    '''Getting all posts by a user (GET), streamed with Accept: application/x-ndjson'''
 
     async with async_session_maker() as session:
 
@@ -363,6 +345,11 @@ async def get_any_user_posts(user_id: int):
         if not user_obj:
             raise HTTPException(status_code=404, detail="User not found")
 
+        if wants_ndjson(request):
+            query = select(Post).join(Post.author).options(contains_eager(Post.author))
+            query = query.where(Post.author_id == user_obj.id).order_by(desc(Post.created_at), desc(Post.id))
+            return stream_ndjson(query, format_post_data)
+
         # Retrieve the user's posts
         posts = await session.execute(select(Post).where(Post.author_id == user_obj.id))
         user_posts = posts.scalars().all()
@@ -392,44 +379,26 @@ async def get_user_liked_posts(user_id: int):
         user_liked_posts = liked_posts.scalars().all()
 
         # Extract the required data and include the author's username
-        formatted_posts = []
-        for post in user_liked_posts:
-            author_username = post.author.username if post.author else None
+        formatted_posts = [{
+            **serialize_post(post),
+            "author_id": post.author_id,
+            "author_username": post.author.username if post.author else None,
+        } for post in user_liked_posts]
 
-            created_at = post.created_at.strftime("%Y-%m-%d") if post.created_at else None
-            updated_at = post.updated_at.strftime("%Y-%m-%d") if post.updated_at else None
-
-            formatted_posts.append({
-                "id": post.id,
-                "title": post.title,
-                "description": post.description,
-                "likes": post.likes,
-                "dislikes": post.dislikes,
-                "views": post.views,
-                "author_id": post.author_id,
-                "author_username": author_username,
-                "created_at": created_at,
-                "updated_at": updated_at,
-            })
-
-        return formatted_posts
+        return ORJSONResponse(formatted_posts)
 
 
 @router.get("/elasticsearch")
-async def elastic_search_posts(q: str, index_resource: IndexResource = Depends(IndexResource)):
-    '''Search posts by title or description (GET)'''
-
-    # Define the Elasticsearch search query
-    search_query = {"query": {"multi_match": {"query": q, "fields": ["title", "description"]}}}
-
-    # Search posts using Elasticsearch
-    try:
-        search_results = index_resource.search.get_data(index_name='posts', search_query=search_query, size=10)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Error while querying Elasticsearch")
-
-    formatted_posts = []
-    for hit in search_results['hits']['hits']:
-        formatted_posts.append(hit['_source'])
+async def elastic_search_posts(
+    q: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    search_index: Search = Depends(get_search),
+):
+    '''Search posts by title or description (GET), most relevant first'''
 
-    return formatted_posts
+    async with async_session_maker() as session:
+        try:
+            return await search_index_page(session, search_index, q, cursor, limit)
+        except OpenSearchException:
+            raise HTTPException(status_code=500, detail="Error while querying Elasticsearch")
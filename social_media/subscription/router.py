@@ -1,17 +1,21 @@
 '''Handling Subscription section'''
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 
 from social_media.auth.jwt.jwt_bearer import JwtBearer
 from social_media.auth.jwt.jwt_handler import verify_token
-from social_media.auth.models import Subscription, User, Post
+from social_media.auth.models import Subscription, User
 from social_media.database import async_session_maker
 from social_media.helpers.auth_user import get_authenticated_user
+from social_media.helpers.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from social_media.helpers.timeline import get_timeline_page, reset_timeline
 
 from .schemas import SubscriptionSchema
 
-router = APIRouter(prefix="/subscription", tags=["Subscription"])
+router = APIRouter(prefix="/subscription", tags=["Subscription"], default_response_class=ORJSONResponse)
 
 
 @router.post("/subscriptions", dependencies=[Depends(JwtBearer())])
@@ -42,28 +46,24 @@ async def create_subscription(subscription: SubscriptionSchema, token: str = Dep
         session.add(new_subscription)
         await session.commit()
 
+    # The home timeline is rebuilt with the new account's posts on next read
+    await reset_timeline(subscriber_obj.id)
+
     return {"message": "Subscription created successfully"}
 
 
 @router.get("/subscribed_posts", dependencies=[Depends(JwtBearer())])
-async def get_subscribed_posts(token: str = Depends(JwtBearer())):
-    '''Retrieving all subscribed users posts'''
+async def get_subscribed_posts(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    token: str = Depends(JwtBearer()),
+):
+    '''Retrieving subscribed users posts from the home timeline, newest first'''
     # Retrieve the authenticated user
     user_obj = await get_authenticated_user(token)
 
     async with async_session_maker() as session:
-
-        # Retrieve the IDs of the users that the current user is subscribed to
-        subscriptions = await session.execute(
-            select(Subscription.subscribed_to_id).where(Subscription.subscriber_id == user_obj.id)
-        )
-        subscribed_user_ids = [sub[0] for sub in subscriptions]
-
-        # Retrieve the posts from the subscribed users
-        posts = await session.execute(select(Post).where(Post.author_id.in_(subscribed_user_ids)))
-        subscribed_posts = posts.scalars().all()
-
-    return subscribed_posts
+        return await get_timeline_page(session, user_obj.id, cursor, limit)
 
 
 @router.get("/subscriptions/{user_id}", dependencies=[Depends(JwtBearer())])
@@ -132,4 +132,6 @@ async def delete_subscription(subscription_id: int, token: str = Depends(JwtBear
         await session.delete(existing_subscription)
         await session.commit()
 
+    await reset_timeline(existing_subscription.subscriber_id)
+
     return {"message": "Subscription deleted successfully"}
@@ -4,10 +4,45 @@ import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from celery import Celery
-from social_media.config import SMTP_HOST, SMTP_PASSWORD, SMTP_PORT, SMTP_USER, REDIS_HOST, REDIS_PORT
+from redis.exceptions import ResponseError
+from sqlalchemy import Float, Integer, column, delete, func, insert, select, update, values
+from sqlalchemy.orm import aliased
+from social_media.ai.model import RecommendationModel
+from social_media.ai.recommendations import (
+    CHANGED_POSTS_KEY, RECOMMENDATION_MODEL_LOCK, RECOMMENDATION_REFIT_INTERVAL, RECOMMENDATION_UPDATE_INTERVAL,
+    UPDATING_POSTS_KEY
+)
+from social_media.ai.collaborative import CO_LIKES_REFRESH_INTERVAL, compute_co_likes
+from social_media.auth.models import Post, PostCoLike, PostRecommendation, Subscription
+from social_media.cache import sync_redis_client
+from social_media.config import (
+    SMTP_HOST, SMTP_PASSWORD, SMTP_PORT, SMTP_USER, REDIS_HOST, REDIS_PORT, RECOMMENDATION_LSH_BITS,
+    RECOMMENDATION_LSH_MIN_POSTS, RECOMMENDATION_LSH_TABLES, RECOMMENDATION_MODEL_PATH
+)
+from social_media.database import sync_session_maker
+from social_media.elastic.client import sync_client
+from social_media.elastic.outbox import (
+    SEARCH_OUTBOX_BATCH_SIZE, SEARCH_OUTBOX_INTERVAL, SEARCH_OUTBOX_LOCK, drain_outbox
+)
+from social_media.helpers.timeline import (
+    CELEBRITIES_KEY, FANOUT_MAX_FOLLOWERS, PUSH_TO_TIMELINE_SCRIPT, TIMELINE_KEY, TIMELINE_SIZE, timeline_member,
+    timeline_score
+)
+from social_media.helpers.view_counter import (
+    FLUSHING_VIEWS_KEY, PENDING_VIEWS_KEY, VIEW_FLUSH_INTERVAL, VIEW_FLUSH_LOCK
+)
 
 celery = Celery('tasks', broker=f"redis://{REDIS_HOST}:{REDIS_PORT}")
 
+# Followers read from the database and pushed to Redis per round trip
+FANOUT_BATCH_SIZE = 1000
+# Posts updated per UPDATE ... FROM (VALUES ...) statement when flushing views
+VIEW_FLUSH_BATCH_SIZE = 1000
+# Rows inserted per statement when rewriting post_recommendations
+RECOMMENDATION_BATCH_SIZE = 5000
+
+push_to_timeline = sync_redis_client.register_script(PUSH_TO_TIMELINE_SCRIPT)
+
 
 @celery.task
 def send_verification_code(email, verification_code):
@@ -43,3 +78,225 @@ def send_verification_code(email, verification_code):
         print(f"Failed to send verification code email: {str(smtp_ex)}")
     except Exception as ex:
         print(f"An error occurred while sending verification code email: {str(ex)}")
+
+
+@celery.task
+def fan_out_post(post_id, author_id):
+    '''Pushing a new post to the timelines of the author's followers'''
+    if sync_redis_client.sismember(CELEBRITIES_KEY, author_id):
+        return
+
+    with sync_session_maker() as session:
+        followers_count = session.scalar(
+            select(func.count(Subscription.id)).where(Subscription.subscribed_to_id == author_id)
+        )
+        if followers_count > FANOUT_MAX_FOLLOWERS:
+            # Too many followers to write to, readers merge this author's posts on demand
+            sync_redis_client.sadd(CELEBRITIES_KEY, author_id)
+            return
+
+        created_at = session.scalar(select(Post.created_at).where(Post.id == post_id))
+        if created_at is None:
+            # Deleted before it was fanned out
+            return
+        args = [timeline_score(created_at), timeline_member(post_id), TIMELINE_SIZE]
+
+        followers = session.execute(
+            select(Subscription.subscriber_id).where(Subscription.subscribed_to_id == author_id
+                                                     ).execution_options(yield_per=FANOUT_BATCH_SIZE)
+        )
+        for follower_ids in followers.scalars().partitions():
+            with sync_redis_client.pipeline(transaction=False) as pipe:
+                for follower_id in follower_ids:
+                    push_to_timeline(keys=[TIMELINE_KEY.format(user_id=follower_id)], args=args, client=pipe)
+                pipe.execute()
+
+
+@celery.task
+def flush_view_counts():
+    '''Applying buffered view counts to Postgres in batched updates'''
+    lock = sync_redis_client.lock(VIEW_FLUSH_LOCK, timeout=5 * 60)
+    if not lock.acquire(blocking=False):
+        # Another flush is still running
+        return
+
+    try:
+        # A leftover hash means the previous flush failed before committing, so it is retried first
+        if not sync_redis_client.exists(FLUSHING_VIEWS_KEY):
+            try:
+                sync_redis_client.rename(PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY)
+            except ResponseError:
+                # No views since the last flush
+                return
+
+        buffered = sync_redis_client.hgetall(FLUSHING_VIEWS_KEY)
+        view_counts = [(int(post_id), int(count)) for post_id, count in buffered.items()]
+
+        with sync_session_maker() as session:
+            for start in range(0, len(view_counts), VIEW_FLUSH_BATCH_SIZE):
+                deltas = values(column("id", Integer), column("delta", Integer),
+                                name="deltas").data(view_counts[start:start + VIEW_FLUSH_BATCH_SIZE])
+                session.execute(update(Post).where(Post.id == deltas.c.id).values(views=Post.views + deltas.c.delta))
+            session.commit()
+
+        # Still under the lock, no other run can see the applied counts as a leftover
+        sync_redis_client.delete(FLUSHING_VIEWS_KEY)
+    finally:
+        lock.release()
+
+
+def insert_ranked_posts(session, table, rows):
+    '''Inserting (post_id, rank, other post id, score) rows into a ranked post pairs table in batches'''
+    post_column, rank_column, other_column, score_column = [column.name for column in table.__table__.columns]
+    other_post = aliased(Post)
+
+    for start in range(0, len(rows), RECOMMENDATION_BATCH_SIZE):
+        batch = values(
+            column(post_column, Integer),
+            column(rank_column, Integer),
+            column(other_column, Integer),
+            column(score_column, Float),
+            name="batch",
+        ).data(rows[start:start + RECOMMENDATION_BATCH_SIZE])
+        # Posts deleted since the rows were computed are skipped instead of violating the foreign keys
+        session.execute(
+            insert(table).from_select(
+                [post_column, rank_column, other_column, score_column],
+                select(batch).join(Post, Post.id == batch.c[post_column]
+                                   ).join(other_post, other_post.id == batch.c[other_column]),
+            )
+        )
+
+
+def store_recommendations(session, model, post_ids=None):
+    '''Rewriting the post_recommendations rows of some posts, or of all of them, from the model'''
+    if post_ids is None:
+        session.execute(delete(PostRecommendation))
+    elif post_ids:
+        session.execute(delete(PostRecommendation).where(PostRecommendation.post_id.in_(post_ids)))
+    else:
+        return
+
+    insert_ranked_posts(session, PostRecommendation, list(model.recommendation_rows(post_ids)))
+
+
+@celery.task
+def refit_recommendation_model():
+    '''Fitting the recommendation model on all posts and rewriting all recommendations'''
+    with sync_redis_client.lock(RECOMMENDATION_MODEL_LOCK, timeout=30 * 60, blocking_timeout=30 * 60):
+        with sync_session_maker() as session:
+            posts = session.execute(select(Post.id, Post.description).order_by(Post.id)).all()
+            if not posts:
+                return
+
+            lsh_tables = RECOMMENDATION_LSH_TABLES if len(posts) >= RECOMMENDATION_LSH_MIN_POSTS else 0
+            model = RecommendationModel.fit(posts, lsh_tables, RECOMMENDATION_LSH_BITS)
+            model.save(RECOMMENDATION_MODEL_PATH)
+
+            # Replaced in one transaction, readers see either the old or the new recommendations
+            store_recommendations(session, model)
+            session.commit()
+
+
+@celery.task
+def update_recommendation_model():
+    '''Applying the posts changed since the last run to the model and rewriting the recommendations they affect'''
+    lock = sync_redis_client.lock(RECOMMENDATION_MODEL_LOCK, timeout=30 * 60)
+    if not lock.acquire(blocking=False):
+        # A refit or an earlier update is running, the changes wait for the next run
+        return
+
+    try:
+        # A leftover set means the previous update failed, so it is retried before taking new changes
+        if not sync_redis_client.exists(UPDATING_POSTS_KEY):
+            try:
+                sync_redis_client.rename(CHANGED_POSTS_KEY, UPDATING_POSTS_KEY)
+            except ResponseError:
+                # No changes since the last update
+                return
+
+        if RecommendationModel.current_version(RECOMMENDATION_MODEL_PATH) is None:
+            # Nothing to update yet, the first refit picks the posts up
+            sync_redis_client.delete(UPDATING_POSTS_KEY)
+            refit_recommendation_model.delay()
+            return
+
+        post_ids = [int(post_id) for post_id in sync_redis_client.smembers(UPDATING_POSTS_KEY)]
+
+        # Loaded into memory, the mapped version stays untouched for the processes reading it
+        model = RecommendationModel.load(RECOMMENDATION_MODEL_PATH, mmap=False)
+
+        with sync_session_maker() as session:
+            posts = session.execute(select(Post.id, Post.description).where(Post.id.in_(post_ids))).all()
+            removed_ids = set(post_ids) - {post.id for post in posts}
+
+            # One pass over the arrays and one new version for the whole batch
+            updated_ids = model.update(posts, removed_ids)
+            model.save(RECOMMENDATION_MODEL_PATH)
+
+            store_recommendations(session, model, updated_ids)
+            session.commit()
+
+        sync_redis_client.delete(UPDATING_POSTS_KEY)
+    finally:
+        lock.release()
+
+
+@celery.task
+def refresh_co_likes():
+    '''Rebuilding the "also liked" posts from the reactions table'''
+    with sync_session_maker() as session:
+        rows = compute_co_likes(session)
+
+        # Replaced in one transaction, readers see either the old or the new pairs
+        session.execute(delete(PostCoLike))
+        insert_ranked_posts(session, PostCoLike, rows)
+        session.commit()
+
+
+@celery.task
+def drain_search_outbox():
+    '''Sending posts changed since the last run to the search index in bulk'''
+    lock = sync_redis_client.lock(SEARCH_OUTBOX_LOCK, timeout=5 * 60)
+    if not lock.acquire(blocking=False):
+        # Another drain is still running
+        return
+
+    client = sync_client()
+    try:
+        with sync_session_maker() as session:
+            # Each batch is committed on its own, releasing its claimed rows
+            while True:
+                claimed = drain_outbox(session, client)
+                session.commit()
+                if claimed < SEARCH_OUTBOX_BATCH_SIZE:
+                    break
+                # A long backlog keeps the lock for as long as batches keep coming
+                lock.reacquire()
+    finally:
+        client.close()
+        lock.release()
+
+
+celery.conf.beat_schedule = {
+    "flush-view-counts": {
+        "task": flush_view_counts.name,
+        "schedule": VIEW_FLUSH_INTERVAL,
+    },
+    "refit-recommendation-model": {
+        "task": refit_recommendation_model.name,
+        "schedule": RECOMMENDATION_REFIT_INTERVAL,
+    },
+    "update-recommendation-model": {
+        "task": update_recommendation_model.name,
+        "schedule": RECOMMENDATION_UPDATE_INTERVAL,
+    },
+    "refresh-co-likes": {
+        "task": refresh_co_likes.name,
+        "schedule": CO_LIKES_REFRESH_INTERVAL,
+    },
+    "drain-search-outbox": {
+        "task": drain_search_outbox.name,
+        "schedule": SEARCH_OUTBOX_INTERVAL,
+    },
+}
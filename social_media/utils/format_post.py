@@ -1,40 +1,61 @@
+from datetime import datetime, time
+from functools import lru_cache
+
 import humanize
-from datetime import datetime
-from sqlalchemy import func, select
-from social_media.auth.models import Comment, CommentResponse
 
+DAY_SECONDS = 24 * 60 * 60
+
+
+def _day(value):
+    # The model declares Date, but the columns were created as timestamps, so both can come back
+    return value.date() if isinstance(value, datetime) else value
+
+
+# Post dates only matter by day, so a feed only ever holds a handful of distinct values.
+# Formatting is cached per day instead of being redone for every row.
+@lru_cache(maxsize=4096)
+def _format_day(day):
+    return day.strftime("%Y-%m-%d")
 
-async def format_post_data(post, session):
-    num_comments = await session.execute(select(func.count(Comment.id)).where(Comment.post_id == post.id))
-    num_comments = num_comments.scalar()
 
-    num_comment_responses = await session.execute(
-        select(func.count(CommentResponse.id)
-               ).join(Comment, Comment.id == CommentResponse.comment_id).where(Comment.post_id == post.id)
-    )
-    num_comment_responses = num_comment_responses.scalar()
+# Past a day naturaltime only resolves whole days, so every post of the same age in days shares one entry
+@lru_cache(maxsize=4096)
+def _time_ago(seconds):
+    return humanize.naturaltime(seconds)
 
-    comments = num_comments + num_comment_responses
 
-    author_username = post.author.username if post.author else None
-    author_name = post.author.name if post.author else None
-    author_surname = post.author.surname if post.author else None
+def format_date(value):
+    '''Post date as YYYY-MM-DD, timestamps are cut to their day'''
+    return _format_day(_day(value)) if value else None
 
-    created_at = post.created_at
-    updated_at = post.updated_at
 
-    if created_at:
-        time_difference = datetime.utcnow() - created_at
-        created_time_ago = humanize.naturaltime(time_difference)
-    else:
-        created_time_ago = None
+def time_ago(value):
+    '''Relative time of a post timestamp, measured from UTC now like the stored values'''
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    seconds = int((datetime.utcnow() - value).total_seconds())
+    if seconds >= DAY_SECONDS:
+        seconds -= seconds % DAY_SECONDS
+    return _time_ago(seconds)
 
-    if updated_at:
-        time_difference = datetime.utcnow() - updated_at
-        updated_time_ago = humanize.naturaltime(time_difference)
-    else:
-        updated_time_ago = None
+
+def serialize_author(author):
+    '''Shared author payload'''
+    if not author:
+        return None
 
+    return {
+        "id": author.id,
+        "username": author.username,
+        "name": author.name,
+        "surname": author.surname,
+    }
+
+
+def serialize_post(post):
+    '''Shared post payload, callers add author and counter fields on top of it'''
     return {
         "id": post.id,
         "title": post.title,
@@ -42,14 +63,34 @@ async def format_post_data(post, session):
         "likes": post.likes,
         "dislikes": post.dislikes,
         "views": post.views,
-        "comments": comments,
+        "created_at": format_date(post.created_at),
+        "updated_at": format_date(post.updated_at),
+    }
+
+
+def format_post_data(post):
+    '''Feed payload, the shared post fields with counters, image and author on top'''
+    author = post.author
+    post_data = serialize_post(post)
+    # The feed has always listed the dates last, each followed by its relative time
+    created_at = post_data.pop("created_at")
+    updated_at = post_data.pop("updated_at")
+
+    return {
+        **post_data,
+        "comments": post.comment_count,
         "image": post.image,
         "author_id": post.author_id,
-        "author_username": author_username,
-        "author_name": author_name,
-        "author_surname": author_surname,
-        "created_at": created_at.strftime("%Y-%m-%d") if created_at else None,
-        "created_time_ago": created_time_ago,
-        "updated_at": updated_at.strftime("%Y-%m-%d") if updated_at else None,
-        "updated_time_ago": updated_time_ago,
+        "author_username": author.username if author else None,
+        "author_name": author.name if author else None,
+        "author_surname": author.surname if author else None,
+        "created_at": created_at,
+        "created_time_ago": time_ago(post.created_at),
+        "updated_at": updated_at,
+        "updated_time_ago": time_ago(post.updated_at),
     }
+
+
+def format_posts_data(posts):
+    '''Format a list of posts'''
+    return [format_post_data(post) for post in posts]
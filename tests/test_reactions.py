@@ -0,0 +1,87 @@
+'''Concurrent reactions against the configured, migrated Postgres database (make migrate)
+
+The test creates its own users and post and removes them afterwards. It is skipped
+when the database cannot be reached.
+'''
+import asyncio
+import unittest
+import uuid
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from social_media.auth.models import Post, Reaction, User
+from social_media.database import DATABASE_URL
+from social_media.helpers.reactions import apply_reaction
+
+READERS = 60
+REPEATS = 3
+
+
+class ConcurrentReactionsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(DATABASE_URL, pool_size=20, max_overflow=0)
+        self.session_maker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        prefix = f"reactions-test-{uuid.uuid4().hex[:8]}"
+
+        try:
+            async with self.engine.begin() as conn:
+                users = await conn.execute(
+                    insert(User).values([{
+                        "username": f"{prefix}-{number}",
+                        "email": f"{prefix}-{number}@example.com"
+                    } for number in range(READERS + 1)]).returning(User.id)
+                )
+                self.author_id, *self.reader_ids = sorted(users.scalars())
+                self.post_id = await conn.scalar(
+                    insert(Post).values(title=prefix, description="", author_id=self.author_id).returning(Post.id)
+                )
+        except (OSError, DBAPIError) as exc:
+            await self.engine.dispose()
+            self.skipTest(f"database unavailable: {exc}")
+
+    async def asyncTearDown(self):
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(Reaction).where(Reaction.post_id == self.post_id))
+            await conn.execute(delete(Post).where(Post.id == self.post_id))
+            await conn.execute(delete(User).where(User.id.in_([self.author_id, *self.reader_ids])))
+        await self.engine.dispose()
+
+    async def react(self, user_id, reaction):
+        async with self.session_maker() as session:
+            if await apply_reaction(session, self.post_id, user_id, reaction):
+                await session.commit()
+
+    async def test_concurrent_reactions_keep_one_row_per_user_and_exact_counters(self):
+        likers = self.reader_ids[0::3]
+        dislikers = self.reader_ids[1::3]
+        switchers = self.reader_ids[2::3]
+
+        # Repeated identical reactions, and likes racing dislikes of the same user
+        requests = [(user_id, "like") for user_id in likers for _ in range(REPEATS)]
+        requests += [(user_id, "dislike") for user_id in dislikers for _ in range(REPEATS)]
+        requests += [(user_id, reaction) for user_id in switchers for reaction in ("like", "dislike", "like")]
+        requests.append((self.author_id, "like"))
+        await asyncio.gather(*(self.react(user_id, reaction) for user_id, reaction in requests))
+
+        async with self.session_maker() as session:
+            query = select(Reaction.user_id, func.count(), func.min(Reaction.reaction))
+            query = query.where(Reaction.post_id == self.post_id).group_by(Reaction.user_id)
+            rows = (await session.execute(query)).all()
+            post = await session.get(Post, self.post_id)
+
+        reactions = {user_id: reaction for user_id, _, reaction in rows}
+        self.assertTrue(all(count == 1 for _, count, _ in rows), "a (user, post) pair has several rows")
+        self.assertEqual(set(reactions), set(self.reader_ids), "the author's own reaction was recorded")
+        self.assertTrue(all(reactions[user_id] == "like" for user_id in likers))
+        self.assertTrue(all(reactions[user_id] == "dislike" for user_id in dislikers))
+
+        likes = sum(reaction == "like" for reaction in reactions.values())
+        self.assertEqual((post.likes, post.dislikes), (likes, len(reactions) - likes))
+
+
+if __name__ == "__main__":
+    unittest.main()